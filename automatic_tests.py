@@ -1,13 +1,49 @@
 from kdtree.kdtree import KDtree
+from kdtree.flat_kdtree import FlatKDtree
 from quadtree.quad import Quad
+from quadtree.linear_quad import LinearQuad
+from common.stats import QueryStats
 import generators
+import loaders
 import numpy as np
+import os
+import tempfile
 
 ns = [100, 300, 500, 1000, 10**4, 10**5]
 left, right = -1000, 1000
 
 tests = []
 
+def random_range():
+    """
+    Funkcja losuje prostokąt zapytania o wierzchołkach z obszaru od left do right
+    :return: para (lower_left, upper_right)
+    """
+    p1 = np.random.uniform(left, right, size=2)
+    p2 = np.random.uniform(left, right, size=2)
+    return (min(p1[0], p2[0]), min(p1[1], p2[1])), (max(p1[0], p2[0]), max(p1[1], p2[1]))
+
+def range_points(points, lower_left, upper_right):
+    """
+    Funkcja wyznacza punkty w prostokącie przez sprawdzenie wszystkich punktów
+    :param points: lista krotek współrzędnych albo tablica (n, 2)
+    :return: zbiór krotek współrzędnych punktów w prostokącie
+    """
+    coords = np.asarray(points, dtype = float).reshape(-1, 2)
+    mask = np.all((coords >= lower_left) & (coords <= upper_right), axis = 1)
+    return set(map(tuple, coords[mask].tolist()))
+
+def check_range(tree, points, lower_left, upper_right):
+    """
+    Funkcja porównuje wynik zapytania drzewa (query_range lub query) i jego liczbę (count) z wynikiem range_points
+    :param tree: drzewo zbudowane z points
+    :param points: punkty drzewa
+    :return: True, jeśli wyniki są zgodne
+    """
+    query = tree.query_range if hasattr(tree, 'query_range') else tree.query
+    res = range_points(points, lower_left, upper_right)
+    return set(query(lower_left, upper_right)) == res and tree.count(lower_left, upper_right) == len(res)
+
 def runtests_all():
     for i in ns:
         tests.append(generators.generate_uniform_points(left, right, i))
@@ -19,19 +55,225 @@ def runtests_all():
         tests.append(generators.generate_square_points(axis_n = i // 2, diag_n = i // 2))
 
     for test in tests:
-        p1 = np.random.uniform(left, right, size=2)
-        p2 = np.random.uniform(left, right, size=2)
-        lower_left, upper_right = (min(p1[0], p2[0]), min(p1[1], p2[1])), (max(p1[0], p2[0]), max(p1[1], p2[1]))
+        lower_left, upper_right = random_range()
         Q = Quad(test)
         res1 = Q.query_range(lower_left, upper_right)
         KD = KDtree(test)
         res2 = set(KD.query(lower_left, upper_right))
+        FKD = FlatKDtree(test)
+        res3 = set(FKD.query(lower_left, upper_right))
+        QC = Quad(test, compressed = True)
+        LQ = LinearQuad(test)
+
+        _, idx1 = Q.query_many([lower_left], [upper_right])
+        _, idx2 = KD.query_many([lower_left], [upper_right])
+        _, idx3 = FKD.query_many([lower_left], [upper_right])
+        batched = [{tuple(Q.points[i]) for i in idx1}, {test[i] for i in idx2}, {test[i] for i in idx3}, set(Q.iter_range(lower_left, upper_right)), QC.query_range(lower_left, upper_right), LQ.query_range(lower_left, upper_right)]
+
+        counts = [tree.count(lower_left, upper_right) for tree in (Q, KD, FKD, QC, LQ)]
+        anys = [tree.any_in(lower_left, upper_right) for tree in (Q, KD, FKD, QC, LQ)]
 
-        if res1 != res2:
+        if res1 != res2 or res2 != res3 or any(res != res1 for res in batched):
             print('Błąd - niezgodne wyniki między algorytmami!')
             return
 
+        if any(count != len(res1) for count in counts) or any(found != bool(res1) for found in anys):
+            print('Błąd - niezgodna liczba punktów w obszarze!')
+            return
+
     print('Testy zaliczone!')
 
+def runtests_io():
+    points = generators.generate_uniform_points(left, right, 10**4)
+    trees = [Quad(points), KDtree(points), FlatKDtree(points)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for i, tree in enumerate(trees):
+            path = os.path.join(directory, f'{i}.idx')
+            tree.save(path)
+            loaded = type(tree).load(path)
+            for _ in range(20):
+                lower_left, upper_right = random_range()
+                if not check_range(tree, points, lower_left, upper_right) or not check_range(loaded, points, lower_left, upper_right):
+                    print('Błąd - niezgodne wyniki po odczycie z pliku!')
+                    return
+
+    print('Testy zapisu i odczytu zaliczone!')
+
+def runtests_parallel():
+    points = generators.generate_uniform_points(left, right, 2 * 10**5)
+    sequential, parallel = FlatKDtree(points), FlatKDtree(points, workers = 2)
+    KD, parallel_KD = KDtree(points), KDtree(points, workers = 2)
+
+    for _ in range(20):
+        lower_left, upper_right = random_range()
+        if not all(check_range(tree, points, lower_left, upper_right) for tree in (sequential, parallel, KD, parallel_KD)):
+            print('Błąd - niezgodne wyniki budowy równoległej!')
+            return
+
+    #równoległa budowa daje te same podziały, a drzewo można dalej zmieniać
+    if KD.root.line != parallel_KD.root.line or KD.root.size != parallel_KD.root.size or not parallel_KD.delete(points[0]) or parallel_KD.count((left, left), (right, right)) != len(points) - 1:
+        print('Błąd - niezgodna struktura drzewa budowanego równolegle!')
+        return
+
+    print('Testy budowy równoległej zaliczone!')
+
+def runtests_updates():
+    for compressed in (False, True):
+        points = generators.generate_uniform_points(left, right, 10**4)
+        Q, live = Quad(points[:100], bucket_size = 4, compressed = compressed), list(points)
+        Q.insert_many(points[100:])
+
+        for step in range(5000):
+            if step % 2:
+                point = live.pop(np.random.randint(len(live)))
+                new = tuple(np.random.uniform(left, right, size=2).tolist())
+                Q.move(point, new)
+                live.append(new)
+            elif step % 4:
+                Q.remove(live.pop(np.random.randint(len(live))))
+            else:
+                #punkty spoza kwadratu korzenia powiększają drzewo
+                point = tuple(np.random.uniform(2 * left, 2 * right, size=2).tolist())
+                Q.insert(point)
+                live.append(point)
+
+        for _ in range(20):
+            lower_left, upper_right = random_range()
+            if not check_range(Q, live, lower_left, upper_right):
+                print('Błąd - niezgodne wyniki po usuwaniu i przenoszeniu punktów!')
+                return
+
+        if Q.n != len(live) or sum(len(leaf.indices) for leaf in Q.leaves) != len(live) or not Q.growths:
+            print('Błąd - niezgodna liczba punktów w liściach!')
+            return
+
+        #przeniesienie w punkt o niesk. lub nieokreślonej współrzędnej jest odrzucane, a punkt zostaje w drzewie
+        for new in ((np.nan, 0), (0, np.inf)):
+            try:
+                Q.move(live[0], new)
+                print('Błąd - przeniesienie w punkt o nieskończonej współrzędnej!')
+                return
+            except ValueError:
+                pass
+        if Q.n != len(live) or live[0] not in Q.query_range(live[0], live[0]):
+            print('Błąd - punkt usunięty przez nieudane przeniesienie!')
+            return
+
+    print('Testy wstawiania, usuwania i przenoszenia punktów zaliczone!')
+
+def runtests_stats():
+    points = generators.generate_clustered_points(generators.generate_uniform_points(left, right, 4), 100, 2500)
+    for tree, query in ((KDtree(points), 'query'), (Quad(points), 'query_range')):
+        for _ in range(20):
+            lower_left, upper_right = random_range()
+            res = range_points(points, lower_left, upper_right)
+            tree.stats = QueryStats()
+            traced = set(getattr(tree, query)(lower_left, upper_right))
+            count = tree.count(lower_left, upper_right)
+            records = tree.stats.records
+            if traced != res or count != len(res) or [record['found'] for record in records] != [len(res), len(res)]:
+                print('Błąd - niezgodne wyniki zapytań ze statystykami!')
+                return
+            if any(record['pruned'] > record['visited'] for record in records):
+                print('Błąd - niepoprawne statystyki zapytań!')
+                return
+
+    print('Testy statystyk zapytań zaliczone!')
+
+def runtests_arrays():
+    points = generators.generate_clustered_points(generators.generate_uniform_points(left, right, 4), 100, 2500, as_array = True)
+    points.flags.writeable = False
+    KD, Q, QC = KDtree(points), Quad(points), Quad(points, compressed = True)
+    if not all(np.shares_memory(tree.coords, points) for tree in (KD, Q, QC)):
+        print('Błąd - drzewa skopiowały tablicę punktów!')
+        return
+
+    test = list(map(tuple, points.tolist()))
+    for _ in range(20):
+        lower_left, upper_right = random_range()
+        res = range_points(points, lower_left, upper_right)
+        found = [KD.query_indices(lower_left, upper_right), Q.query_range_indices(lower_left, upper_right), QC.query_range_indices(lower_left, upper_right)]
+        if set(KD.query(lower_left, upper_right)) != res or Q.query_range(lower_left, upper_right) != res or any({test[i] for i in indices} != res for indices in found):
+            print('Błąd - niezgodne wyniki drzew zbudowanych z tablicy!')
+            return
+
+    #zmiany drzew nie mogą zmieniać przekazanej tablicy
+    KD.insert((0, 0))
+    KD.delete(test[0])
+    Q.insert((0, 0))
+    Q.remove(test[0])
+    QC.move(test[1], (0, 0))
+    if list(map(tuple, points.tolist())) != test:
+        print('Błąd - zmiana drzewa zmieniła tablicę punktów!')
+        return
+
+    #usunięcie ostatniego wiersza zwalnia miejsce w tablicy, ale wstawianie nie może do niej pisać
+    for insert in (lambda tree, point: tree.insert(point), lambda tree, point: tree.insert_many([point])):
+        array = points.copy()
+        Q = Quad(array)
+        Q.remove(tuple(array[-1]))
+        insert(Q, (0, 0))
+        if not (array == points).all() or Q.count((0, 0), (0, 0)) != 1:
+            print('Błąd - zmiana drzewa zmieniła tablicę punktów!')
+            return
+    Q = Quad(points)
+    Q.remove(test[-1])
+    Q.insert((0, 0))
+
+    print('Testy drzew zbudowanych z tablicy zaliczone!')
+
+def runtests_loaders():
+    points = generators.generate_normal_points(0, 300, 10**4, as_array = True)
+    test = list(map(tuple, points.tolist()))
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, binary_path = os.path.join(directory, 'points.csv'), os.path.join(directory, 'points.bin')
+        with open(csv_path, 'w') as file:
+            file.write('x,y,label\n')
+            np.savetxt(file, np.column_stack((points, np.arange(len(points)))), delimiter = ',', fmt = '%.17g')
+        n = loaders.write_binary_points(binary_path, loaders.read_csv_points(csv_path, skiprows = 1, chunk_size = 999))
+
+        trees = [loaders.build_kdtree(loaders.read_csv_points(csv_path, skiprows = 1, chunk_size = 999)),
+                 loaders.build_quad(loaders.read_binary_points(binary_path, chunk_size = 999)),
+                 KDtree(loaders.map_binary_points(binary_path))]
+        collected = loaders.collect_points(loaders.read_csv_points(csv_path, skiprows = 1, chunk_size = 999))
+        if loaders.read_binary_points(binary_path).count != n or collected.shape != points.shape or not np.array_equal(collected, points):
+            print('Błąd - niezgodne punkty wczytane z plików!')
+            return
+        for _ in range(20):
+            lower_left, upper_right = random_range()
+            if n != len(test) or not all(check_range(tree, points, lower_left, upper_right) for tree in trees):
+                print('Błąd - niezgodne wyniki drzew zbudowanych z plików!')
+                return
+        del trees
+
+    print('Testy wczytywania punktów z plików zaliczone!')
+
+def runtests_generators():
+    centers = generators.generate_uniform_points(left, right, 3, seed = 1)
+    cases = [(generators.generate_uniform_points, {'left': left, 'right': right}), (generators.generate_normal_points, {'mean': 0, 'std': 100}),
+             (generators.generate_collinear_points, {'a': (left, left), 'b': (right, right)}), (generators.generate_rectangle_points, {}),
+             (generators.generate_square_points, {}), (generators.generate_clustered_points, {'cluster_centers': centers, 'cluster_std': 100}),
+             (generators.generate_grid_points, {})]
+    n = 1001
+    for generate, kwargs in cases:
+        expected = generate(n = n, seed = 7, as_array = True, **kwargs)
+        whole = np.concatenate(list(generators.stream_points(generate, n, chunk_size = len(expected), seed = 7, **kwargs)))
+        for chunk_size in (100, 7):
+            chunks = list(generators.stream_points(generate, n, chunk_size = chunk_size, seed = 7, **kwargs))
+            #porcje mają dawać dokładnie te same punkty co jedno wywołanie generatora
+            if not np.array_equal(whole, expected) or not np.array_equal(np.concatenate(chunks), expected) or any(len(chunk) > chunk_size for chunk in chunks):
+                print(f'Błąd - niezgodne porcje generatora {generate.__name__}!')
+                return
+
+    print('Testy generatorów porcjami zaliczone!')
+
 if __name__ == '__main__':
-    runtests_all()
\ No newline at end of file
+    runtests_all()
+    runtests_io()
+    runtests_parallel()
+    runtests_updates()
+    runtests_stats()
+    runtests_arrays()
+    runtests_loaders()
+    runtests_generators()
\ No newline at end of file
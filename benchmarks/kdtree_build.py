@@ -0,0 +1,83 @@
+"""Build time and memory of `KDtree` for different dimensions and split rules.
+
+The build overhead is the peak of memory allocated during the build minus the memory held by the tree.
+The `presort` rows build the same round-robin tree by the reference build used before nodes were split
+by in-place selection: the points are argsorted along every axis once, and every node copies the k sorted
+index arrays into its children. They are measured over the coordinate array of an already built tree.
+
+Run from the repository root:
+
+    python -m benchmarks.kdtree_build
+"""
+import time
+import tracemalloc
+import numpy as np
+from kdtree.kdtree import KDtree, Node
+
+N = 10 ** 5
+DIMENSIONS = [2, 3, 7]
+
+def presort_build(coords, leaf_size):
+    """Build the round-robin tree over an (n, k) array from k presorted index arrays (the reference build).
+
+    Returns the root `Node`, with the same splits as `KDtree(coords, k, leaf_size = leaf_size)`.
+    """
+    n, k = coords.shape
+    # marks of the points going to the left child and the indices of the points in leaf order
+    side, perm = np.zeros(n, dtype = bool), np.empty(n, dtype = np.int64)
+
+    def build(P, depth, start):
+        m = len(P[0])
+        block = perm[start:start + m]
+        if m <= leaf_size:
+            block[:] = P[0]
+            points = coords[block]
+            return Node(indices = block, lower = tuple(points.min(axis = 0).tolist()), upper = tuple(points.max(axis = 0).tolist()))
+
+        axis, half = depth % k, (m - 1) // 2 + 1
+        line = float(coords[P[axis][half - 1], axis])
+        side[P[axis][:half]] = True
+        prep_P_left, prep_P_right = [], []
+        for i in range(k):
+            mask = side[P[i]]
+            prep_P_left.append(P[i][mask])
+            prep_P_right.append(P[i][~mask])
+        side[P[axis][:half]] = False
+
+        left = build(prep_P_left, depth + 1, start)
+        right = build(prep_P_right, depth + 1, start + half)
+        return Node(line = line, axis = axis, left = left, right = right, indices = block,
+                    lower = tuple(map(min, left.lower, right.lower)), upper = tuple(map(max, left.upper, right.upper)))
+
+    return build([np.argsort(coords[:, i], kind = 'stable') for i in range(k)], 0, 0)
+
+def measure(build):
+    """Run a build and return its time, the memory held by the tree and the peak of memory allocated during the build."""
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tree = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tree
+    return elapsed, current, peak
+
+def run():
+    rng = np.random.default_rng(0)
+    print(f'{"k":>2} {"split rule":<17} {"build [s]":>10} {"tree [MB]":>10} {"peak [MB]":>10} {"build overhead [MB]":>20}')
+    for k in DIMENSIONS:
+        points = [tuple(point) for point in rng.uniform(-1000, 1000, size = (N, k)).tolist()]
+        tree = KDtree(points, k)
+        reference = presort_build(tree.coords, tree.leaf_size)
+        # the reference build splits the root at the same line, into blocks of the same points
+        assert reference.line == tree.root.line and set(reference.left.indices.tolist()) == set(tree.root.left.indices.tolist())
+        builds = [('presort', lambda: presort_build(tree.coords, tree.leaf_size))]
+        builds += [(split_rule, lambda split_rule = split_rule: KDtree(points, k, split_rule = split_rule)) for split_rule in KDtree.split_rules]
+        for name, build in builds:
+            elapsed, current, peak = measure(build)
+            print(f'{k:>2} {name:<17} {elapsed:>10.2f} {current / 2**20:>10.1f} {peak / 2**20:>10.1f} {(peak - current) / 2**20:>20.1f}', flush = True)
+
+if __name__ == '__main__':
+    run()
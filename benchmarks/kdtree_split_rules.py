@@ -0,0 +1,52 @@
+"""Split rules of `KDtree`: build time and nodes visited by range and kNN queries.
+
+Run from the repository root:
+
+    python -m benchmarks.kdtree_split_rules
+"""
+import time
+import numpy as np
+import generators
+from kdtree.kdtree import KDtree
+from benchmarks.kdtree_traversal import random_queries
+
+N = 10 ** 5
+QUERIES = 200
+left, right = -1000, 1000
+
+datasets = {
+    'uniform': lambda: generators.generate_uniform_points(left, right, N),
+    'clustered': lambda: generators.generate_clustered_points(generators.generate_uniform_points(left, right, 4), 10, N // 4),
+    'collinear': lambda: generators.generate_collinear_points((left, left), (right, right), N),
+    'square': lambda: generators.generate_square_points(axis_n = N // 2, diag_n = N // 2),
+}
+
+def run():
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    print(f'{"dataset":<10} {"split rule":<17} {"build [s]":>10} {"query [ms]":>11} {"visited":>8} {"knn [ms]":>9} {"knn visited":>12}')
+    for name, generate in datasets.items():
+        points = generate()
+        lowers, uppers, _ = random_queries(points, QUERIES, rng, side = 0.05)
+        lowers, uppers, centres = lowers.tolist(), uppers.tolist(), ((lowers + uppers) / 2).tolist()
+        for split_rule in KDtree.split_rules:
+            start = time.perf_counter()
+            KD = KDtree(points, split_rule = split_rule)
+            build = time.perf_counter() - start
+
+            start, visited = time.perf_counter(), 0
+            for a, b in zip(lowers, uppers):
+                KD.query(a, b)
+                visited += KD.visited
+            query = 1000 * (time.perf_counter() - start) / QUERIES
+
+            start, knn_visited = time.perf_counter(), 0
+            for c in centres:
+                KD.knn(c, 10)
+                knn_visited += KD.visited
+            knn = 1000 * (time.perf_counter() - start) / QUERIES
+
+            print(f'{name:<10} {split_rule:<17} {build:>10.2f} {query:>11.3f} {visited / QUERIES:>8.1f} {knn:>9.3f} {knn_visited / QUERIES:>12.1f}', flush = True)
+
+if __name__ == '__main__':
+    run()
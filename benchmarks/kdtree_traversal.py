@@ -0,0 +1,149 @@
+"""Query times of `KDtree` (range, count, kNN and radius queries) and nodes visited by range queries.
+
+The `rec` columns time reference recursive searches over the same tree - the traversal used before
+searches switched to explicit stacks over node bounding boxes: the region of a node is cut out by the
+splitting lines above it and narrowed / restored on the way down, and the radius and kNN searches prune
+with the distance to the splitting line only. `visited` is the mean number of nodes whose box (tight
+bounding box, or region in the recursive search) a range query tests, `rec` after it for the recursive search.
+
+Run from the repository root:
+
+    python -m benchmarks.kdtree_traversal
+"""
+import heapq
+import time
+import numpy as np
+import generators
+from kdtree.kdtree import KDtree
+
+N = 10 ** 5
+QUERIES = 200
+left, right = -1000, 1000
+
+datasets = {
+    'uniform': lambda: generators.generate_uniform_points(left, right, N),
+    'normal': lambda: generators.generate_normal_points(0, 100, N),
+    'clustered': lambda: generators.generate_clustered_points(generators.generate_uniform_points(left, right, 4), 10, N // 4),
+    'collinear': lambda: generators.generate_collinear_points((left, left), (right, right), N),
+    # many points on the same coordinates
+    'ties': lambda: generators.generate_collinear_points((left, left), (right, right), N // 100) * 100,
+}
+
+def random_queries(points, count, rng, side = 0.1):
+    """Query squares with a side of `side` of the bounding box of points, centred at random points."""
+    points = np.asarray(points, dtype = float)
+    half = side * (points.max(axis = 0) - points.min(axis = 0)) / 2
+    centres = points[rng.integers(len(points), size = count)]
+    return centres - half, centres + half, float(half.mean())
+
+def recursive_query(tree, lower_left, upper_right):
+    """Indices of points within the range, found by the recursive search with backtracked region bounds.
+
+    Returns a pair (list of index arrays, number of nodes visited - the root and every child whose region is tested).
+    """
+    k, eps = tree.k, tree.eps
+    lo, hi = np.subtract(lower_left, eps), np.add(upper_right, eps)
+
+    def contains(lower, upper):
+        return all(lower_left[i] - lower[i] <= eps and upper_right[i] - upper[i] >= -eps for i in range(k))
+
+    def intersects(lower, upper):
+        return all(upper[i] - lower_left[i] >= -eps and lower[i] - upper_right[i] <= eps for i in range(k))
+
+    visited = 1
+
+    def search(v, lower, upper):
+        nonlocal visited
+        if v.left is None and v.right is None:
+            coords = tree.coords[v.indices]
+            return [v.indices[np.all((coords >= lo) & (coords <= hi), axis = 1)]]
+        found, axis = [], v.axis
+        visited += (v.left is not None) + (v.right is not None)
+        if v.left is not None:
+            old, upper[axis] = upper[axis], v.line
+            if contains(lower, upper): found += v.left.report_indices()
+            elif intersects(lower, upper): found += search(v.left, lower, upper)
+            upper[axis] = old
+        if v.right is not None:
+            old, lower[axis] = lower[axis], v.line
+            if contains(lower, upper): found += v.right.report_indices()
+            elif intersects(lower, upper): found += search(v.right, lower, upper)
+            lower[axis] = old
+        return found
+
+    found = search(tree.root, [-np.inf] * k, [np.inf] * k)
+    return found, visited
+
+def recursive_radius(tree, point, r):
+    """Indices of points within distance r, found by the recursive search pruned by the splitting lines."""
+    r += tree.eps
+
+    def search(v):
+        if v.left is None and v.right is None:
+            return [v.indices[np.sum((tree.coords[v.indices] - point) ** 2, axis = 1) <= r * r]]
+        diff, found = point[v.axis] - v.line, []
+        if v.left is not None and diff <= r: found += search(v.left)
+        if v.right is not None and -diff <= r: found += search(v.right)
+        return found
+
+    return search(tree.root)
+
+def recursive_knn(tree, point, k):
+    """Pairs (squared distance, index) of the k nearest neighbours, found by the recursive branch and bound search."""
+    heap = []
+
+    def search(v):
+        if v.left is None and v.right is None:
+            dists = np.sum((tree.coords[v.indices] - point) ** 2, axis = 1)
+            for dist, index in zip(dists.tolist(), v.indices.tolist()):
+                if len(heap) < k: heapq.heappush(heap, (-dist, index))
+                elif dist < -heap[0][0]: heapq.heapreplace(heap, (-dist, index))
+            return
+        diff = point[v.axis] - v.line
+        near, far = (v.left, v.right) if diff <= 0 else (v.right, v.left)
+        if near is not None: search(near)
+        gap = max(abs(diff) - tree.eps, 0)
+        if far is not None and (len(heap) < k or gap * gap < -heap[0][0]): search(far)
+
+    search(tree.root)
+    return sorted((-dist, index) for dist, index in heap)
+
+def timed(queries):
+    """Mean time of a query in milliseconds."""
+    start = time.perf_counter()
+    for query in queries: query()
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+def run():
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    print(f'{"dataset":<10} {"leaf":>4} {"build [s]":>10} {"query [ms]":>11} {"rec":>7} {"count [ms]":>11} {"knn [ms]":>9} {"rec":>7} {"radius [ms]":>12} {"rec":>7} {"visited":>8} {"rec":>7}')
+    for name, generate in datasets.items():
+        points = generate()
+        lowers, uppers, r = random_queries(points, QUERIES, rng)
+        lowers, uppers, centres = lowers.tolist(), uppers.tolist(), ((lowers + uppers) / 2).tolist()
+        for leaf_size in (1, 16):
+            start = time.perf_counter()
+            KD = KDtree(points, leaf_size = leaf_size)
+            build = time.perf_counter() - start
+            query = timed([lambda a = a, b = b: KD.query(a, b) for a, b in zip(lowers, uppers)])
+            count = timed([lambda a = a, b = b: KD.count(a, b) for a, b in zip(lowers, uppers)])
+            knn = timed([lambda c = c: KD.knn(c, 10) for c in centres])
+            radius = timed([lambda c = c: KD.query_radius(c, r) for c in centres])
+            rec_query = timed([lambda a = a, b = b: [KD.points[i] for i in np.concatenate(recursive_query(KD, a, b)[0]).tolist()] for a, b in zip(lowers, uppers)])
+            rec_knn = timed([lambda c = c: [KD.points[i] for _, i in recursive_knn(KD, c, 10)] for c in centres])
+            rec_radius = timed([lambda c = c: [KD.points[i] for i in np.concatenate(recursive_radius(KD, c, r)).tolist()] for c in centres])
+            # the reference searches find the same points
+            a, b, c = lowers[0], uppers[0], centres[0]
+            assert sorted(np.concatenate(recursive_query(KD, a, b)[0]).tolist()) == sorted(KD.query_indices(a, b).tolist())
+            assert sorted(np.concatenate(recursive_radius(KD, c, r)).tolist()) == sorted(KD.query_radius_indices(c, r).tolist())
+            assert [dist for dist, _ in recursive_knn(KD, c, 10)] == [sum((x - y) ** 2 for x, y in zip(p, c)) for p in KD.knn(c, 10)]
+            visited, rec_visited = 0, 0
+            for a, b in zip(lowers, uppers):
+                KD.query_indices(a, b)
+                visited += KD.visited
+                rec_visited += recursive_query(KD, a, b)[1]
+            print(f'{name:<10} {leaf_size:>4} {build:>10.2f} {query:>11.3f} {rec_query:>7.3f} {count:>11.3f} {knn:>9.3f} {rec_knn:>7.3f} {radius:>12.3f} {rec_radius:>7.3f} {visited / QUERIES:>8.1f} {rec_visited / QUERIES:>7.1f}', flush = True)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,54 @@
+"""Memory, build and query cost of the pointer-based `Quad` and the linear (Morton-code) `LinearQuad`.
+
+Run from the repository root:
+
+    python -m benchmarks.linear_quad
+"""
+import time
+import tracemalloc
+import numpy as np
+from quadtree.quad import Quad
+from quadtree.linear_quad import LinearQuad
+from benchmarks.quad_bucket_size import datasets, random_queries
+
+BUCKET_SIZES = [1, 16]
+QUERIES = 100
+
+def measure(build):
+    """Build a tree, returning it with the build time and the memory held by a second, traced build."""
+    start = time.perf_counter()
+    tree = build()
+    elapsed = time.perf_counter() - start
+
+    # tracing slows the build down, so memory is measured separately
+    tracemalloc.start()
+    traced = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+    return tree, elapsed, memory
+
+def run():
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    print(f'{"dataset":<10} {"bucket":>6} {"tree":>10} {"build [s]":>10} {"memory [MB]":>12} {"query [ms]":>11} {"many [ms]":>10}')
+    for name, generate in datasets.items():
+        points = np.asarray(generate())
+        lowers, uppers = random_queries(points, QUERIES, rng)
+        for bucket_size in BUCKET_SIZES:
+            for label, cls in (('Quad', Quad), ('LinearQuad', LinearQuad)):
+                tree, build, memory = measure(lambda: cls(points, bucket_size = bucket_size))
+
+                start = time.perf_counter()
+                for lower, upper in zip(lowers, uppers):
+                    tree.query_range(lower, upper)
+                query = (time.perf_counter() - start) / QUERIES * 1000
+
+                start = time.perf_counter()
+                tree.query_many(lowers, uppers)
+                many = (time.perf_counter() - start) / QUERIES * 1000
+
+                print(f'{name:<10} {bucket_size:>6} {label:>10} {build:>10.3f} {memory / 2**20:>12.1f} {query:>11.3f} {many:>10.3f}', flush = True)
+
+if __name__ == '__main__':
+    run()
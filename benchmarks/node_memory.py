@@ -0,0 +1,97 @@
+"""Memory held by the object-based trees (`KDtree` and `Quad`), in total and per node.
+
+`bytes / node` is the size of a node of the built tree. The `dict` columns give the size of a node, and the
+memory of the whole tree, with reference copies of the node classes used before nodes switched to `__slots__`:
+attributes in a per-instance `__dict__`, the square of a quadtree node in a separate `Rectangle`-like object
+and a separate empty index array in every empty leaf. Both per-node sizes are measured by copying every node
+of the built tree into the given classes.
+
+Run from the repository root:
+
+    python -m benchmarks.node_memory
+"""
+import tracemalloc
+import numpy as np
+import generators
+from kdtree.kdtree import KDtree, Node as KDNode
+from quadtree.quad import Quad, NO_INDICES
+
+SIZES = [10 ** 4, 10 ** 5]
+left, right = -1000, 1000
+
+class DictKDNode:
+    """Reference `kdtree.Node` without `__slots__` - the attributes are kept in a per-instance `__dict__`."""
+    def __init__(self, node):
+        for name in KDNode.__slots__:
+            setattr(self, name, getattr(node, name))
+
+class DictRectangle:
+    """Reference `quad.Rectangle` without `__slots__`."""
+    def __init__(self, min_x, min_y, max_x, max_y):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+
+class DictQuadNode:
+    """Reference `quad.Node` without `__slots__`, holding its square as a separate rectangle object."""
+    def __init__(self, node):
+        self.tree = node.tree
+        self.quarter = node.quarter
+        self.parent = node.parent
+        self.square = DictRectangle(node.min_x, node.min_y, node.max_x, node.max_y)
+        self.ne, self.nw, self.sw, self.se = node.ne, node.nw, node.sw, node.se
+        # every empty leaf had its own empty index array
+        self.indices = np.empty(0, dtype = np.int64) if node.indices is NO_INDICES else node.indices
+        self.size = node.size
+
+def slotted_copy(node):
+    """Copy a node into a new instance of its own (slotted) class."""
+    copy = object.__new__(type(node))
+    for cls in type(node).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            setattr(copy, name, getattr(node, name))
+    return copy
+
+def tree_nodes(root, children):
+    """List the nodes of a tree, given a function returning the children of a node."""
+    nodes, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(child for child in children(node) if child is not None)
+    return nodes
+
+def count_nodes(root, children):
+    """Count the nodes of a tree, given a function returning the children of a node."""
+    return len(tree_nodes(root, children))
+
+def measure(build):
+    """Call build and return its result with the memory it allocated (and still holds)."""
+    tracemalloc.start()
+    result = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, memory
+
+def run():
+    np.random.seed(0)
+    print(f'{"tree":<6} {"n":>8} {"nodes":>9} {"memory [MB]":>12} {"bytes / node":>13} {"dict [B]":>9} {"dict memory [MB]":>17}')
+    for n in SIZES:
+        points = generators.generate_uniform_points(left, right, n)
+        trees = (
+            ('KDtree', lambda: KDtree(points), lambda node: (node.left, node.right), DictKDNode),
+            ('Quad', lambda: Quad(points), lambda node: (node.ne, node.nw, node.sw, node.se), DictQuadNode),
+        )
+        for name, build, children, reference in trees:
+            tree, memory = measure(build)
+            nodes = tree_nodes(tree.root, children)
+            # both copies also hold one list slot per node
+            slotted = measure(lambda: [slotted_copy(node) for node in nodes])[1] / len(nodes)
+            dicts = measure(lambda: [reference(node) for node in nodes])[1] / len(nodes)
+            # the same tree with nodes of the reference classes
+            before = memory + (dicts - slotted) * len(nodes)
+            print(f'{name:<6} {n:>8} {len(nodes):>9} {memory / 2**20:>12.1f} {slotted:>13.0f} {dicts:>9.0f} {before / 2**20:>17.1f}', flush = True)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,51 @@
+"""Build / query trade-off of the quadtree leaf capacity.
+
+Run from the repository root:
+
+    python -m benchmarks.quad_bucket_size
+"""
+import time
+import numpy as np
+import generators
+from quadtree.quad import Quad
+
+BUCKET_SIZES = [1, 2, 4, 8, 16, 32, 64, 128]
+N = 10 ** 5
+QUERIES = 100
+left, right = -1000, 1000
+
+datasets = {
+    'uniform': lambda: generators.generate_uniform_points(left, right, N),
+    'normal': lambda: generators.generate_normal_points(0, 100, N),
+    'clustered': lambda: generators.generate_clustered_points(generators.generate_uniform_points(left, right, 4), 10, N // 4),
+    'collinear': lambda: generators.generate_collinear_points((left, left), (right, right), N),
+}
+
+def random_queries(points, count, rng):
+    """Query rectangles with corners drawn from the bounding box of points."""
+    points = np.asarray(points)
+    low, high = points.min(axis = 0), points.max(axis = 0)
+    a, b = rng.uniform(low, high, size = (count, 2)), rng.uniform(low, high, size = (count, 2))
+    return np.minimum(a, b), np.maximum(a, b)
+
+def run():
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    print(f'{"dataset":<10} {"bucket":>6} {"build [s]":>10} {"query [ms]":>11} {"leaves":>8}')
+    for name, generate in datasets.items():
+        points = generate()
+        lowers, uppers = random_queries(points, QUERIES, rng)
+        for bucket_size in BUCKET_SIZES:
+            start = time.perf_counter()
+            Q = Quad(points, bucket_size = bucket_size)
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for lower, upper in zip(lowers, uppers):
+                Q.query_range(lower, upper)
+            query = (time.perf_counter() - start) / QUERIES * 1000
+
+            print(f'{name:<10} {bucket_size:>6} {build:>10.3f} {query:>11.3f} {len(Q.leaves):>8}')
+
+if __name__ == '__main__':
+    run()
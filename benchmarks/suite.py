@@ -0,0 +1,209 @@
+"""Reproducible benchmark suite of `KDtree` and `Quad`.
+
+For every generator from `generators.py` and every size, the suite measures the build time, the peak
+memory of a build, the node count and query latency percentiles (p50 / p95 / p99) for several query
+selectivities (the fraction of the bounding box of the points covered by a query). Datasets are generated
+in chunks from seeded generators into one float64 array (no list of tuples, also for 10^7 points) and queries
+are drawn from the same seed (`random_queries` of `benchmarks.kdtree_traversal`). Every measurement is preceded
+by warm-up runs and repeated, and the results are written as JSON. Given a baseline file, the suite flags metrics
+which got worse by more than a threshold.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --sizes 1000000 10000000 --generators uniform clustered --output large.json
+    python -m benchmarks.suite --output new.json --baseline baseline.json
+    python -m benchmarks.suite --compare baseline.json new.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import generators
+import loaders
+from benchmarks.kdtree_traversal import random_queries
+from benchmarks.node_memory import count_nodes
+from kdtree.kdtree import KDtree
+from quadtree.quad import Quad
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+SELECTIVITIES = [0.0001, 0.001, 0.01, 0.1]
+PERCENTILES = [50, 95, 99]
+CHUNK_SIZE = 10 ** 5 # points generated at once - bounds the temporary arrays of the generators
+left, right = -1000, 1000
+
+# name: (generator, its arguments other than n, seed and as_array)
+datasets = {
+    'uniform': (generators.generate_uniform_points, {'left': left, 'right': right}),
+    'normal': (generators.generate_normal_points, {'mean': 0, 'std': 100}),
+    'grid': (generators.generate_grid_points, {}),
+    'clustered': (generators.generate_clustered_points, {'cluster_centers': generators.generate_uniform_points(left, right, 4, seed = 0), 'cluster_std': 100}),
+    'collinear': (generators.generate_collinear_points, {'a': (left, left), 'b': (right, right)}),
+    'rectangle': (generators.generate_rectangle_points, {}),
+    'square': (generators.generate_square_points, {}),
+}
+
+# name: (build, range query, root, children of a node)
+trees = {
+    'KDtree': (KDtree, lambda tree, a, b: tree.query(a, b), lambda tree: tree.root, lambda node: (node.left, node.right)),
+    'Quad': (Quad, lambda tree, a, b: tree.query_range(a, b), lambda tree: tree.root, lambda node: (node.ne, node.nw, node.sw, node.se)),
+}
+
+def dataset(name, n, seed):
+    """Points of a dataset as an (n, 2) float64 array, generated in chunks from the seed.
+
+    The grid has the square number of points nearest to n.
+    """
+    generate, kwargs = datasets[name]
+    if generate is generators.generate_grid_points:
+        n = int(round(n ** 0.5))
+        count = n * n
+    else:
+        count = n
+    return loaders.collect_points(generators.stream_points(generate, n, CHUNK_SIZE, seed, **kwargs), 2, count)
+
+def measure_build(build, points, warmup, repeats):
+    """Build times in seconds of `repeats` builds, after `warmup` untimed ones; returns the last tree as well."""
+    for _ in range(warmup): build(points)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        tree = build(points)
+        times.append(time.perf_counter() - start)
+    return tree, times
+
+def measure_memory(build, points):
+    """Peak of memory in bytes allocated during a build (traced separately, since tracing slows the build)."""
+    tracemalloc.start()
+    tree = build(points)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del tree
+    return peak
+
+def measure_queries(query, tree, lowers, uppers, warmup, repeats):
+    """Latency percentiles in microseconds and the mean number of points found by the queries."""
+    for _ in range(warmup):
+        for a, b in zip(lowers, uppers): query(tree, a, b)
+    latencies, found = [], 0
+    for _ in range(repeats):
+        for a, b in zip(lowers, uppers):
+            start = time.perf_counter_ns()
+            result = query(tree, a, b)
+            latencies.append((time.perf_counter_ns() - start) / 1000)
+            found += len(result)
+    stats = {f'p{p}': float(value) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))}
+    stats['found'] = found / (repeats * len(lowers))
+    return stats
+
+def run(args):
+    """Run the benchmarks and return the results as a JSON-serializable dictionary."""
+    results = []
+    for name in args.generators:
+        for n in args.sizes:
+            points = dataset(name, n, args.seed)
+            rng = np.random.default_rng(args.seed)
+            queries = {}
+            for s in SELECTIVITIES:
+                # squares covering the fraction s of the bounding box
+                lowers, uppers, _ = random_queries(points, args.queries, rng, side = np.sqrt(s))
+                queries[s] = (lowers.tolist(), uppers.tolist())
+
+            for tree_name in args.trees:
+                build, query, root, children = trees[tree_name]
+                tree, times = measure_build(build, points, args.warmup, args.repeats)
+                entry = {
+                    'generator': name, 'n': len(points), 'tree': tree_name,
+                    'build_time': {'median': float(np.median(times)), 'min': min(times)},
+                    'nodes': count_nodes(root(tree), children),
+                    'queries': {str(s): measure_queries(query, tree, lowers, uppers, args.warmup, args.repeats)
+                                for s, (lowers, uppers) in queries.items()},
+                }
+                del tree
+                if not args.no_memory: entry['peak_memory'] = measure_memory(build, points)
+                results.append(entry)
+
+                line = ' '.join(f'{s}: {q["p50"]:.0f}/{q["p95"]:.0f}/{q["p99"]:.0f}' for s, q in entry['queries'].items())
+                print(f'{name:<10} {len(points):>9} {tree_name:<6} build {entry["build_time"]["median"]:8.3f} s, '
+                      f'{entry["nodes"]:>9} nodes, query p50/p95/p99 [us] {line}', flush = True)
+
+    return {
+        'meta': {
+            'seed': args.seed, 'repeats': args.repeats, 'warmup': args.warmup, 'queries': args.queries,
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+def metrics(entry):
+    """Flatten the compared metrics of a result entry into a dictionary {name: value} (lower is better)."""
+    values = {'build_time': entry['build_time']['median'], 'nodes': entry['nodes']}
+    if 'peak_memory' in entry: values['peak_memory'] = entry['peak_memory']
+    for s, stats in entry['queries'].items():
+        for p in PERCENTILES:
+            values[f'query {s} p{p}'] = stats[f'p{p}']
+    return values
+
+def compare(baseline, current, threshold):
+    """Compare results with a baseline.
+
+    Returns:
+        list: Tuples (generator, n, tree, metric, baseline value, current value) of metrics
+              which grew by more than `threshold` (a fraction of the baseline value).
+    """
+    old = {(e['generator'], e['n'], e['tree']): metrics(e) for e in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        key = (entry['generator'], entry['n'], entry['tree'])
+        if key not in old: continue
+        for metric, value in metrics(entry).items():
+            before = old[key].get(metric)
+            if before is not None and value > before * (1 + threshold):
+                regressions.append(key + (metric, before, value))
+    return regressions
+
+def report(regressions, threshold):
+    """Print regressions and return the exit status of the suite."""
+    if not regressions:
+        print(f'No regressions above {threshold:.0%}.')
+        return 0
+    print(f'{len(regressions)} regressions above {threshold:.0%}:')
+    for name, n, tree, metric, before, value in regressions:
+        print(f'  {name:<10} {n:>9} {tree:<6} {metric:<20} {before:12.4g} -> {value:12.4g} ({value / before - 1:+.0%})')
+    return 1
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Reproducible benchmarks of KDtree and Quad.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = SIZES, help = 'numbers of points (up to 10^7)')
+    parser.add_argument('--generators', nargs = '+', default = list(datasets), choices = list(datasets))
+    parser.add_argument('--trees', nargs = '+', default = list(trees), choices = list(trees))
+    parser.add_argument('--queries', type = int, default = 200, help = 'queries per selectivity')
+    parser.add_argument('--repeats', type = int, default = 3)
+    parser.add_argument('--warmup', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the traced build measuring peak memory')
+    parser.add_argument('--output', help = 'path of the JSON file with the results')
+    parser.add_argument('--baseline', help = 'JSON file of an earlier run to compare the results with')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BASELINE', 'CURRENT'), help = 'only compare two JSON files')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'allowed relative growth of a metric')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            return report(compare(json.load(a), json.load(b), args.threshold), args.threshold)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            return report(compare(json.load(file), results, args.threshold), args.threshold)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
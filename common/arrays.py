@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def as_point_array(P, k):
+    """View points given as an ndarray or another buffer-protocol object (e.g. `array.array`, `memoryview`) as an (n, k) array.
+
+    Floating-point data is not copied - the returned array shares memory with P, so trees built
+    from it refer to the points by row index. Integer data is converted to float64 (a copy),
+    and a one-dimensional buffer is read as consecutive k-dimensional points.
+
+    Parameters:
+        P: The points.
+        k (int): Number of dimensions.
+
+    Returns:
+        numpy.ndarray: The (n, k) array of points, or None if P is neither an ndarray
+                       nor a buffer (e.g. a list of tuples).
+
+    Raises:
+        TypeError: If the points do not match the declared dimension k.
+    """
+    if not isinstance(P, np.ndarray):
+        try:
+            P = np.asarray(memoryview(P))
+        except TypeError:
+            return None
+
+    if P.dtype.kind != 'f': P = P.astype(float)
+    if P.ndim == 1 and P.size % k == 0: P = P.reshape(-1, k)
+    if P.ndim != 2 or P.shape[1] != k: raise TypeError('Points does not match declared dimension!')
+    return P
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+def to_csr(m, queries, indices):
+    """Group (query number, point index) pairs into CSR layout.
+
+    Parameters:
+        m (int): Number of queries.
+        queries (numpy.ndarray): Query number of every pair.
+        indices (numpy.ndarray): Point index of every pair.
+
+    Returns:
+        tuple: A pair (offsets, indices) - results of the i-th query are `indices[offsets[i]:offsets[i + 1]]`.
+    """
+    offsets = np.zeros(m + 1, dtype = np.int64)
+    offsets[1:] = np.cumsum(np.bincount(queries, minlength = m))
+    return offsets, np.asarray(indices, dtype = np.int64)[np.argsort(queries, kind = 'stable')]
+
+
+def expand_ranges(starts, ends):
+    """Expand half-open ranges [starts[i], ends[i]) into explicit positions.
+
+    Parameters:
+        starts (numpy.ndarray): Beginnings of the ranges.
+        ends (numpy.ndarray): Ends of the ranges.
+
+    Returns:
+        tuple: A pair (owner, positions) - positions of all ranges concatenated and,
+               for every position, the number of the range it comes from.
+    """
+    lengths = ends - starts
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    # position within its own range = global position - offset of the range
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - offsets[owner] + starts[owner]
+    return owner, positions
+
+
+def subtree_boxes(children, depth, lower, upper):
+    """Fill bounding boxes of internal nodes from the boxes of their children, deepest level first.
+
+    Parameters:
+        children (numpy.ndarray): (N, c) array of child numbers, -1 for a missing child.
+        depth (numpy.ndarray): Depth of every node.
+        lower (numpy.ndarray): (N, k) array of lower corners, filled for leaves, modified in place.
+        upper (numpy.ndarray): (N, k) array of upper corners, filled for leaves, modified in place.
+    """
+    internal = np.any(children >= 0, axis = 1)
+    lower[internal], upper[internal] = np.inf, -np.inf
+    for d in range(int(depth.max()), -1, -1):
+        nodes = np.nonzero(internal & (depth == d))[0]
+        for c in range(children.shape[1]):
+            child = children[nodes, c]
+            has = child >= 0
+            lower[nodes[has]] = np.minimum(lower[nodes[has]], lower[child[has]])
+            upper[nodes[has]] = np.maximum(upper[nodes[has]], upper[child[has]])
+
+
+def _inside(lo, hi, points):
+    """Row-wise test whether points[i] lies in the box [lo[i], hi[i]], one column at a time (cheaper than reducing over a short axis)."""
+    inside = np.ones(len(points), dtype = bool)
+    for d in range(points.shape[1]):
+        inside &= (lo[:, d] <= points[:, d]) & (points[:, d] <= hi[:, d])
+    return inside
+
+
+def _classify(lo, hi, node_lo, node_hi, strict):
+    """Row-wise test whether box i of the queries intersects / contains box i of the nodes."""
+    intersects = np.ones(len(lo), dtype = bool)
+    contained = np.ones(len(lo), dtype = bool)
+    for d in range(lo.shape[1]):
+        if strict:
+            intersects &= (lo[:, d] < node_hi[:, d]) & (hi[:, d] > node_lo[:, d])
+        else:
+            intersects &= (lo[:, d] <= node_hi[:, d]) & (hi[:, d] >= node_lo[:, d])
+        contained &= (lo[:, d] <= node_lo[:, d]) & (node_hi[:, d] <= hi[:, d])
+    return intersects, contained & intersects
+
+
+def search_many(children, lower, upper, start, end, order, coords, lowers, uppers, strict = False):
+    """Answer many orthogonal range queries over a flat tree, level by level.
+
+    All (query, node) pairs of one tree level are processed together with array operations, so
+    a node reached by many queries has its box tested against all of them at once. Every node
+    covers positions `start[v]:end[v]` of `order`; nodes whose box lies inside a query report that
+    range as a whole, leaves intersecting a query have their points tested.
+
+    Parameters:
+        children (numpy.ndarray): (N, c) array of child numbers, -1 for a missing child; node 0 is the root.
+        lower (numpy.ndarray): (N, k) array of lower corners of the node boxes.
+        upper (numpy.ndarray): (N, k) array of upper corners of the node boxes.
+        start (numpy.ndarray): Beginning of the range of `order` covered by every node.
+        end (numpy.ndarray): End of the range of `order` covered by every node.
+        order (numpy.ndarray): Point indices in tree order.
+        coords (numpy.ndarray): (n, k) array of coordinates, indexed by the values of `order`.
+        lowers (numpy.ndarray): (m, k) array of lower corners of the queries.
+        uppers (numpy.ndarray): (m, k) array of upper corners of the queries.
+        strict (bool, optional): Whether a box has to overlap a query with positive area
+                                 (as `Rectangle.intersects` requires) to be visited. Default is False.
+
+    Returns:
+        tuple: A pair (offsets, indices) in CSR layout, see `to_csr`.
+    """
+    m = len(lowers)
+    q, v = np.arange(m), np.zeros(m, dtype = np.int64)
+    found_q, found_i = [], []
+    is_leaf = np.all(children < 0, axis = 1)
+
+    while len(q):
+        intersects, contained = _classify(lowers[q], uppers[q], lower[v], upper[v], strict)
+
+        # whole subtrees
+        owner, positions = expand_ranges(start[v[contained]], end[v[contained]])
+        found_q.append(q[contained][owner])
+        found_i.append(order[positions])
+
+        rest = intersects & ~contained
+        q, v = q[rest], v[rest]
+        leaf = is_leaf[v]
+
+        # points of the leaves
+        leaf_q = q[leaf]
+        owner, positions = expand_ranges(start[v[leaf]], end[v[leaf]])
+        leaf_q, indices = leaf_q[owner], order[positions]
+        points = coords[indices]
+        hit = _inside(lowers[leaf_q], uppers[leaf_q], points)
+        found_q.append(leaf_q[hit])
+        found_i.append(indices[hit])
+
+        # next level
+        q, v = q[~leaf], children[v[~leaf]]
+        q = np.repeat(q, children.shape[1])
+        v = v.ravel()
+        keep = v >= 0
+        # subtrees without points cannot contribute anything
+        keep[keep] = start[v[keep]] < end[v[keep]]
+        q, v = q[keep], v[keep]
+
+    return to_csr(m, np.concatenate(found_q), np.concatenate(found_i))
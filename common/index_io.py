@@ -0,0 +1,72 @@
+import json
+import numpy as np
+
+ALIGNMENT = 64
+
+
+def write_index(path, magic, meta, arrays):
+    """Write a tree index as a flat binary file.
+
+    Layout: 8-byte magic, little-endian uint64 header length, JSON header (metadata and the dtype,
+    shape and offset of every array), then the raw C-ordered arrays, each aligned to 64 bytes, so
+    that the file can be mapped with `np.memmap` and used without deserialization.
+
+    Parameters:
+        path (str): Path of the file.
+        magic (bytes): 8-byte identifier of the index type.
+        meta (dict): JSON-serializable metadata of the tree.
+        arrays (dict): Arrays to store, by name.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({'meta': meta, 'arrays': layout}).encode()
+    # the data block starts at an aligned position as well
+    data_start = -(-(16 + len(header)) // ALIGNMENT) * ALIGNMENT
+    header += b' ' * (data_start - 16 - len(header))
+
+    with open(path, 'wb') as file:
+        file.write(magic)
+        file.write(np.array(len(header), dtype = '<u8').tobytes())
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name]['offset'])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+
+
+def read_index(path, magic, mmap = True):
+    """Read a tree index written by `write_index`.
+
+    Parameters:
+        path (str): Path of the file.
+        magic (bytes): Expected 8-byte identifier of the index type.
+        mmap (bool, optional): Whether to map the arrays read-only instead of reading them into memory. Default is True.
+
+    Returns:
+        tuple: A pair (meta, arrays) - the metadata and a dict of arrays by name.
+
+    Raises:
+        ValueError: If the file is not an index of the expected type.
+    """
+    with open(path, 'rb') as file:
+        if file.read(8) != magic: raise ValueError(f'{path} is not a {magic.decode()} index!')
+        header_length = int(np.frombuffer(file.read(8), dtype = '<u8')[0])
+        header = json.loads(file.read(header_length))
+
+    data_start = 16 + header_length
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype, shape = np.dtype(layout['dtype']), tuple(layout['shape'])
+        offset = data_start + layout['offset']
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype = dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype = dtype, mode = 'r', offset = offset, shape = shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype = dtype, count = int(np.prod(shape)), offset = offset).reshape(shape)
+
+    return header['meta'], arrays
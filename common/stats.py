@@ -0,0 +1,77 @@
+import time
+import numpy as np
+
+
+class QueryStats:
+    """Opt-in statistics of range queries (`query`, `count`, `any_in`) of `KDtree` and `Quad`.
+
+    Tracing is switched on by attaching an instance to a tree (`tree.stats = QueryStats()`) and off
+    by setting `tree.stats = None`; the searches take the record of the query as an optional argument
+and record nothing without it.
+    Every traced query produces one record - a dictionary with the kind of the query and the fields
+    listed in `FIELDS`:
+
+        visited - nodes whose region was tested against the query range,
+        pruned - visited nodes skipped because their region does not intersect the range,
+        reported_subtrees - subtrees within the range reported (or counted) whole,
+        points_tested - points of leaves checked one by one against the range,
+        found - number of points found,
+        elapsed - time of the query in seconds.
+    """
+    FIELDS = ('visited', 'pruned', 'reported_subtrees', 'points_tested', 'found', 'elapsed')
+
+    def __init__(self, hook = None, keep = True):
+        """Initialize the statistics.
+
+        Parameters:
+            hook (callable, optional): Function called with every finished record. Default is None.
+            keep (bool, optional): Whether to keep the records in `records`. Default is True.
+        """
+        self.hook = hook
+        self.keep = keep
+        self.records = []
+
+    def start(self, kind):
+        """Open a record of a query of the given kind."""
+        record = dict.fromkeys(QueryStats.FIELDS, 0)
+        record['kind'] = kind
+        record['elapsed'] = time.perf_counter()
+        return record
+
+    def finish(self, record, found):
+        """Close a record opened by `start`, keeping it and passing it to the hook."""
+        record['elapsed'] = time.perf_counter() - record['elapsed']
+        record['found'] = found
+        if self.keep: self.records.append(record)
+        if self.hook is not None: self.hook(record)
+
+    def values(self, field, kind = None):
+        """Return the values of a field in the kept records (only of queries of the given kind, if any) as an array."""
+        return np.array([record[field] for record in self.records if kind is None or record['kind'] == kind])
+
+    def histogram(self, field, bins = 10, kind = None):
+        """Compute a histogram of a field, as `numpy.histogram` - a pair (counts, bin edges)."""
+        return np.histogram(self.values(field, kind), bins = bins)
+
+    def summary(self, kind = None):
+        """Summarize every field of the kept records.
+
+        Returns:
+            dict: {field: {'mean', 'p50', 'p95', 'p99', 'max'}}, empty if there are no records.
+        """
+        if not self.records: return {}
+        summary = {}
+        for field in QueryStats.FIELDS:
+            values = self.values(field, kind)
+            if len(values) == 0: continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[field] = {'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(values.max())}
+        return summary
+
+    def merge(self, other):
+        """Append the records of other statistics (e.g. of another tree)."""
+        self.records += other.records
+
+    def clear(self):
+        """Remove all kept records."""
+        self.records = []
@@ -1,29 +1,72 @@
 import numpy as np
-import random
 
-def generate_uniform_points(left, right, n = 10 ** 5):
+# Wszystkie generatory losują punkty jedną operacją na tablicach. Parametry wspólne:
+#   seed - ziarno (int) albo obiekt np.random.Generator; None oznacza globalny stan np.random
+#          (np. ustawiony przez np.random.seed), jak we wcześniejszych wersjach generatorów
+#   as_array - True zwraca tablicę (n, k) typu float64 zamiast listy krotek
+#   n - liczba generowanych punktów (dla generate_grid_points - liczba punktów wzdłuż jednej osi)
+# Każdy punkt zużywa kolejne liczby losowe jednego generatora, a położenie punktu w zbiorze (wierzchołek,
+# odcinek, klaster) zależy tylko od jego numeru - dzięki temu stream_points daje te same punkty co jedno wywołanie.
+
+def get_rng(seed = None):
+    """
+    Funkcja zwraca generator liczb losowych dla podanego ziarna
+    :param seed: ziarno (int), obiekt np.random.Generator albo None (globalny stan np.random)
+    :return: obiekt z metodami uniform, normal i choice
+    """
+    if seed is None: return np.random
+    if isinstance(seed, np.random.Generator): return seed
+    return np.random.default_rng(seed)
+
+def to_output(points, as_array):
+    """
+    Funkcja zwraca wygenerowane punkty w wybranej postaci
+    :param points: tablica punktów (n, k)
+    :param as_array: True - tablica (n, k) typu float64, False - lista krotek współrzędnych
+    :return: punkty jako tablica albo lista krotek
+    """
+    if as_array: return np.ascontiguousarray(points, dtype = np.float64)
+    return list(map(tuple, points.tolist()))
+
+def points_on_segments(segments, choice, fractions):
+    """
+    Funkcja generuje punkty na odcinkach; i-ty punkt leży na odcinku choice[i]
+    :param segments: lista czwórek (punkt początkowy, wektor, t_start, t_end) - odcinek to punkt + wektor * t dla t z [t_start, t_end]
+    :param choice: tablica numerów odcinków dla kolejnych punktów
+    :param fractions: tablica liczb z [0, 1) - położenie i-tego punktu na jego odcinku
+    :return: tablica punktów (len(choice), 2)
+    """
+    starts = np.array([segment[0] for segment in segments], dtype = float)[choice]
+    vects = np.array([segment[1] for segment in segments], dtype = float)[choice]
+    bounds = np.array([segment[2:] for segment in segments], dtype = float)[choice]
+    t = bounds[:, 0] + (bounds[:, 1] - bounds[:, 0]) * fractions
+    return starts + vects * t[:, None]
+
+def generate_uniform_points(left, right, n = 10 ** 5, k = 2, seed = None, as_array = False):
     """
     Funkcja generuje równomiernie n punktów na kwadwratowym obszarze od left do right (jednakowo na osi y) o współrzędnych rzeczywistych
     :param left: lewy kraniec przedziału
     :param right: prawy kraniec przedziału
     :param n: liczba generowanych punktów
+    :param k: liczba wymiarów
     :return: tablica punktów w postaci krotek współrzędnych np. [(x1, y1), (x2, y2), ... (xn, yn)]
-    """ 
-    points =  np.random.uniform(left, right, size = (n, 2))
-    return [tuple(point) for point in points]
+    """
+    points = get_rng(seed).uniform(left, right, size = (n, k))
+    return to_output(points, as_array)
 
-def generate_normal_points(mean, std, n = 10 ** 5):
+def generate_normal_points(mean, std, n = 10 ** 5, k = 2, seed = None, as_array = False):
     """
     Funkcja generuje n punktów o rozkładzie normalnym na płaszczyźnie o współrzędnych rzeczywistych
     :param mean: średnia wartość rozkładu
     :param std: odchylenie standardowe rozkładu
     :param n: liczba generowanych punktów
+    :param k: liczba wymiarów
     :return: tablica punktów w postaci krotek współrzędnych np. [(x1, y1), (x2, y2), ... (xn, yn)]
-    """ 
-    points = np.random.normal(mean, std, size=(n, 2))
-    return [tuple(point) for point in points]
+    """
+    points = get_rng(seed).normal(mean, std, size = (n, k))
+    return to_output(points, as_array)
 
-def generate_collinear_points(a, b, n = 100, x_range = 1000):
+def generate_collinear_points(a, b, n = 100, x_range = 1000, seed = None, as_array = False):
     """
     Funkcja generuje równomiernie n współliniowych punktów leżących na prostej ab pomiędzy punktami a i b
     :param a: krotka współrzędnych oznaczająca początek wektora tworzącego prostą
@@ -31,21 +74,14 @@ def generate_collinear_points(a, b, n = 100, x_range = 1000):
     :param n: liczba generowanych punktów
     :return: tablica punktów w postaci krotek współrzędnych
     """
-    points = []
     vect = (b[0] - a[0], b[1] - a[1])
     t_start = (-x_range - a[0]) / vect[0]
     t_end = (x_range - a[0]) / vect[0]
 
-    t_factor = np.random.uniform(t_start, t_end, n)
-
-    for t in t_factor:
-        x = a[0] + vect[0] * t
-        y = a[1] + vect[1] * t
-        points.append((x, y))
-
-    return [tuple(point) for point in points]
+    points = points_on_segments([(a, vect, t_start, t_end)], np.zeros(n, dtype = np.int64), get_rng(seed).uniform(0, 1, n))
+    return to_output(points, as_array)
 
-def generate_rectangle_points(a=(-10, -10), b=(10, -10), c=(10, 10), d=(-10, 10), n=100):
+def generate_rectangle_points(a=(-10, -10), b=(10, -10), c=(10, 10), d=(-10, 10), n=100, seed = None, as_array = False):
     '''
     Funkcja generuje n punktów na obwodzie prostokąta
     o wierzchołkach w punktach a, b, c i d
@@ -55,7 +91,7 @@ def generate_rectangle_points(a=(-10, -10), b=(10, -10), c=(10, 10), d=(-10, 10)
     :param d: lewy-górny wierzchołek prostokąta
     :param n: liczba generowanych punktów
     :return: tablica punktów w postaci krotek współrzędnych
-    korzystam z generowania punktów na prostej (będę losowo wybierał prostą, na której wygenerowany zostanie punkt)
+    korzystam z generowania punktów na prostej (losowo wybieram prostą, na której wygenerowany zostanie punkt)
     '''
     # (a, b)
     vect1 = (b[0] - a[0], b[1] - a[1])
@@ -79,19 +115,14 @@ def generate_rectangle_points(a=(-10, -10), b=(10, -10), c=(10, 10), d=(-10, 10)
 
 
     linears = [(a, vect1, t1_start, t1_end), (b, vect2, t2_start, t2_end), (d, vect3, t3_start, t3_end), (a, vect4, t4_start, t4_end)]
-    points = []
-
-    for _ in range(n):
-        point, vect, t_start, t_end = random.choice(linears)
-        t = np.random.uniform(t_start, t_end)
-        x = point[0] + vect[0] * t
-        y = point[1] + vect[1] * t
-        points.append((x, y))
-
-    return [tuple(point) for point in points]
+    #jedna liczba losowa na punkt - część całkowita to numer boku, część ułamkowa to położenie na boku
+    drawn = get_rng(seed).uniform(0, len(linears), n)
+    choice = np.minimum(drawn.astype(np.int64), len(linears) - 1)
+    points = points_on_segments(linears, choice, drawn - choice)
+    return to_output(points, as_array)
 
 def generate_square_points(a=(0, 0), b=(10, 0), c=(10, 10), d=(0, 10),
-                           axis_n=25, diag_n=20):
+                           axis_n=25, diag_n=20, seed = None, as_array = False, n = None, start = 0):
     '''
     Funkcja generuje axis_n punktów na dwóch bokach kwadratu
     leżących na osiach x i y oraz diag_n punktów na
@@ -105,10 +136,12 @@ def generate_square_points(a=(0, 0), b=(10, 0), c=(10, 10), d=(0, 10),
                    z dwóch boków kwadratu równoległych do osi x i y
     :param diag_n: liczba generowanych punktów na każdej
                    przekątnej kwadratu
+    :param n: łączna liczba punktów (zamiast axis_n i diag_n) - wierzchołki kwadratu i po równo
+              punktów na bokach i przekątnych (dla n < 4 tylko n pierwszych wierzchołków)
+    :param start: numer pierwszego punktu (razem z n) - porcja zbioru większego niż n, np. w stream_points;
+                  wierzchołki kwadratu to punkty o numerach 0-3, więc trafiają tylko do pierwszej porcji
     :return: tablica punktów w postaci krotek współrzędnych
     '''
-    points = [a, b, c, d]
-
     # (a, b)
     vect1 = (b[0] - a[0], b[1] - a[1])
     t1_start = 0
@@ -129,43 +162,79 @@ def generate_square_points(a=(0, 0), b=(10, 0), c=(10, 10), d=(0, 10),
     t4_start = 0
     t4_end = (b[0] - d[0]) / vect4[0]
 
-    axis = [(a, vect1, t1_start, t1_end), (a, vect2, t2_start, t2_end)]
-    diagonals = [(a, vect3, t3_start, t3_end), (d, vect4, t4_start, t4_end)]
-
-    for point, vect, t_start, t_end in axis:
-        for _ in range(axis_n):
-            t = np.random.uniform(t_start, t_end)
-            x = point[0] + vect[0] * t
-            y = point[1] + vect[1] * t
-            points.append((x, y))
-
-    for point, vect, t_start, t_end in diagonals:
-        for _ in range(diag_n):
-            t = np.random.uniform(t_start, t_end)
-            x = point[0] + vect[0] * t
-            y = point[1] + vect[1] * t
-            points.append((x, y))
-
-    return [tuple(point) for point in points]
-
-def generate_grid_points(n = 100):
+    segments = [(a, vect1, t1_start, t1_end), (a, vect2, t2_start, t2_end), (a, vect3, t3_start, t3_end), (d, vect4, t4_start, t4_end)]
+    corners = np.array([a, b, c, d], dtype = float)
+    if n is None:
+        # kolejno axis_n punktów na każdym boku i diag_n punktów na każdej przekątnej
+        choice = np.repeat(np.arange(4), [axis_n, axis_n, diag_n, diag_n])
+    else:
+        # punkty o numerach od start: najpierw wierzchołki, potem na przemian boki i przekątne
+        rows = np.arange(start, start + n)
+        corners = corners[rows[rows < 4]]
+        choice = (rows[rows >= 4] - 4) % 4
+
+    points = np.concatenate((corners, points_on_segments(segments, choice, get_rng(seed).uniform(0, 1, len(choice)))))
+    return to_output(points, as_array)
+
+def generate_grid_points(n = 100, as_array = False, seed = None):
     """
     Funkcja generuje punkty na siatce n x n
     :param n: liczba punktów wzdłuż jednej osi
+    :param seed: ignorowane (siatka nie jest losowa) - dla wspólnego interfejsu generatorów
     :return: tablica punktów w postaci krotek współrzędnych
     """
+    if as_array: return grid_rows(n, 0, n * n)
     return [(i, j) for i in range(n) for j in range(n)]
 
-def generate_clustered_points(cluster_centers, cluster_std, points_per_cluster):
+def grid_rows(n, start, end):
+    """
+    Funkcja zwraca punkty siatki n x n o numerach od start do end - 1 (w kolejności generate_grid_points)
+    :param n: liczba punktów wzdłuż jednej osi
+    :param start: numer pierwszego punktu
+    :param end: numer punktu za ostatnim
+    :return: tablica (end - start, 2) typu float64
+    """
+    rows = np.arange(start, end)
+    return np.column_stack((rows // n, rows % n)).astype(np.float64)
+
+def generate_clustered_points(cluster_centers, cluster_std, points_per_cluster = None, seed = None, as_array = False, n = None, start = 0):
     """
     Funkcja generuje punkty w klastrach wokół podanych centrów klastrów
     :param cluster_centers: lista krotek współrzędnych centrów klastrów
     :param cluster_std: odchylenie standardowe dla każdego klastra
     :param points_per_cluster: liczba punktów w każdym klastrze
+    :param n: łączna liczba punktów (zamiast points_per_cluster) - po równo w klastrach, pierwsze klastry dostają resztę
+    :param start: numer pierwszego punktu (razem z n) - porcja zbioru większego niż n, np. w stream_points
     :return: tablica punktów w postaci krotek współrzędnych
     """
-    points = []
-    for center in cluster_centers:
-        cluster_points = np.random.normal(center, cluster_std, size=(points_per_cluster, 2))
-        points.extend(cluster_points)
-    return [tuple(point) for point in points]
\ No newline at end of file
+    centers = np.asarray(cluster_centers, dtype = float)
+    if n is None:
+        if points_per_cluster is None: raise TypeError('Number of points must be given!')
+        n = points_per_cluster * len(centers)
+    #punkt o numerze i należy do klastra i % liczba klastrów
+    offsets = get_rng(seed).normal(0, cluster_std, size = (n, centers.shape[1]))
+    points = centers[np.arange(start, start + n) % len(centers)] + offsets
+    return to_output(points, as_array)
+
+def stream_points(generate, n, chunk_size = 10 ** 6, seed = None, **kwargs):
+    """
+    Funkcja generuje punkty generatora porcjami (np. zbiory większe niż pamięć operacyjna); porcje losowane są
+    kolejno z jednego generatora liczb losowych, więc połączone porcje są równe generate(n = n, seed = seed, as_array = True)
+    niezależnie od chunk_size
+    :param generate: dowolny generator z tego modułu (np. generate_uniform_points)
+    :param n: liczba punktów, jak parametr n generatora (dla generate_grid_points - liczba punktów wzdłuż osi)
+    :param chunk_size: maksymalna liczba punktów w jednej porcji
+    :param seed: ziarno (int) albo obiekt np.random.Generator
+    :param kwargs: pozostałe argumenty generatora (np. left i right)
+    :return: iterator tablic (m, k) typu float64
+    """
+    if generate is generate_grid_points:
+        for start in range(0, n * n, chunk_size):
+            yield grid_rows(n, start, min(start + chunk_size, n * n))
+        return
+    #None - kolejne porcje z globalnego stanu np.random
+    rng = None if seed is None else get_rng(seed)
+    positional = generate in (generate_square_points, generate_clustered_points)
+    for start in range(0, n, chunk_size):
+        if positional: kwargs['start'] = start
+        yield generate(n = min(chunk_size, n - start), seed = rng, as_array = True, **kwargs)
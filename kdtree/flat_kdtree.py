@@ -0,0 +1,645 @@
+import heapq
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from common.batched import search_many, subtree_boxes
+from common.index_io import read_index, write_index
+
+
+NODE_ARRAYS = ('line', 'axis', 'left', 'right', 'start', 'end', 'depth')
+PARALLEL_MIN_POINTS = 10 ** 5 # smaller inputs are always built in the calling process
+
+
+def build_nodes(points, perm, start, end, depth, k, leaf_size, split_depth = None):
+    """Build a KD-tree over `perm[start:end]` iteratively, selecting medians with `np.argpartition`.
+
+    Every internal node splits its range of `perm` positionally at `(n - 1) // 2`,
+    so all points of the left child satisfy `p[axis] <= line` and all points
+    of the right child satisfy `p[axis] >= line`. Nodes are numbered in preorder from 0.
+
+    Parameters:
+        points (numpy.ndarray): An (n, k) array of all points.
+        perm (numpy.ndarray): Index array, permuted in place.
+        start (int): Beginning of the range of perm covered by the tree.
+        end (int): End of the range of perm covered by the tree.
+        depth (int): Depth of the root of the tree.
+        k (int): Number of dimensions.
+        leaf_size (int): Maximal number of points stored in a leaf.
+        split_depth (int, optional): Nodes at this depth are left unsplit and reported as pending. Default is None.
+
+    Returns:
+        tuple: A dict of node arrays (keys from `NODE_ARRAYS`) and a list of pending nodes as (node, start, end, depth).
+    """
+    n = end - start
+    # a node of size m > leaf_size splits into halves of size at least (leaf_size + 1) // 2
+    max_nodes = 2 * (n // max(1, (leaf_size + 1) // 2)) + 1
+
+    line = np.empty(max_nodes, dtype = points.dtype)
+    axes = np.zeros(max_nodes, dtype = np.int8)
+    left = np.full(max_nodes, -1, dtype = np.int64)
+    right = np.full(max_nodes, -1, dtype = np.int64)
+    starts = np.empty(max_nodes, dtype = np.int64)
+    ends = np.empty(max_nodes, dtype = np.int64)
+    depths = np.empty(max_nodes, dtype = np.int16)
+
+    pending = []
+    count = 0
+    # (start, end, depth, parent, is_right_child)
+    stack = [(start, end, depth, -1, False)]
+    while stack:
+        start, end, depth, parent, is_right = stack.pop()
+        v = count
+        count += 1
+        if parent >= 0:
+            if is_right: right[parent] = v
+            else: left[parent] = v
+        starts[v], ends[v] = start, end
+        depths[v] = depth
+
+        m = end - start
+        if m <= leaf_size: continue
+        if depth == split_depth:
+            pending.append((v, start, end, depth))
+            continue
+
+        axis = depth % k
+        mid = (m - 1) // 2
+        block = perm[start:end]
+        block[:] = block[np.argpartition(points[block, axis], mid)]
+        axes[v] = axis
+        line[v] = points[block[mid], axis]
+
+        # right pushed first, so the left child gets index v + 1
+        stack.append((start + mid + 1, end, depth + 1, v, True))
+        stack.append((start, start + mid + 1, depth + 1, v, False))
+
+    arrays = dict(zip(NODE_ARRAYS, (line, axes, left, right, starts, ends, depths)))
+    return {name: array[:count].copy() for name, array in arrays.items()}, pending
+
+
+def build_shared(points_name, shape, dtype, perm_name, start, end, depth, k, leaf_size):
+    """Build a subtree in a worker process over point and perm buffers kept in shared memory.
+
+    The subtree permutes only its own range of the shared perm, so workers never overlap.
+
+    Returns:
+        dict: Node arrays of the subtree, see `build_nodes`.
+    """
+    points_memory, perm_memory = SharedMemory(name = points_name), SharedMemory(name = perm_name)
+    try:
+        points = np.ndarray(shape, dtype = dtype, buffer = points_memory.buf)
+        perm = np.ndarray((shape[0],), dtype = np.int64, buffer = perm_memory.buf)
+        arrays, _ = build_nodes(points, perm, start, end, depth, k, leaf_size)
+        del points, perm # views must be released before closing the buffers
+        return arrays
+    finally:
+        points_memory.close()
+        perm_memory.close()
+
+
+class FlatKDtree:
+    """Array-backed KD-tree data structure.
+
+    The tree is kept in a handful of contiguous arrays instead of `Node` objects.
+    Points are never moved - the build permutes a single index array `perm` in place,
+    so every node (internal or leaf) covers a contiguous range `perm[start:end]`.
+    Node 0 is the root; children are referenced through `left` and `right` (-1 in leaves).
+    """
+    inf = float('inf') # static variable
+    magic = b'KDTREE01' # identifier of the on-disk format
+    node_arrays = NODE_ARRAYS
+
+    def __build_kdtree(self, workers):
+        """Build the KD-tree, optionally handing independent subtrees over to worker processes.
+
+        With more than one worker, the top levels are built in this process until there are about
+        four subtrees per worker. Those are built by a process pool over point and perm buffers
+        in shared memory, and their nodes are appended after the nodes of the top part.
+
+        Parameters:
+            workers (int): Number of processes.
+        """
+        n = len(self.points)
+        if workers <= 1 or n < PARALLEL_MIN_POINTS:
+            arrays, _ = build_nodes(self.points, self.perm, 0, n, 0, self.k, self.leaf_size)
+            self.__set_node_arrays(arrays)
+            return
+
+        split_depth = int(np.ceil(np.log2(4 * workers)))
+        arrays, pending = build_nodes(self.points, self.perm, 0, n, 0, self.k, self.leaf_size, split_depth)
+
+        points_memory = SharedMemory(create = True, size = self.points.nbytes)
+        perm_memory = SharedMemory(create = True, size = self.perm.nbytes)
+        try:
+            shared_points = np.ndarray(self.points.shape, dtype = self.points.dtype, buffer = points_memory.buf)
+            shared_points[:] = self.points
+            shared_perm = np.ndarray(self.perm.shape, dtype = np.int64, buffer = perm_memory.buf)
+            shared_perm[:] = self.perm
+
+            with ProcessPoolExecutor(max_workers = workers) as pool:
+                futures = [pool.submit(build_shared, points_memory.name, self.points.shape, self.points.dtype.str,
+                                       perm_memory.name, start, end, depth, self.k, self.leaf_size)
+                           for _, start, end, depth in pending]
+                subtrees = [future.result() for future in futures]
+
+            self.perm[:] = shared_perm
+            del shared_points, shared_perm
+        finally:
+            points_memory.close()
+            points_memory.unlink()
+            perm_memory.close()
+            perm_memory.unlink()
+
+        # the root of every subtree takes the place of its pending node, the other nodes are appended
+        parts = {name: [array] for name, array in arrays.items()}
+        offset = len(arrays['line'])
+        for (v, _, _, _), subtree in zip(pending, subtrees):
+            for name in ('left', 'right'):
+                children = subtree[name]
+                children[children > 0] += offset - 1
+            for name, array in subtree.items():
+                parts[name][0][v] = array[0]
+                parts[name].append(array[1:])
+            offset += len(subtree['line']) - 1
+
+        self.__set_node_arrays({name: np.concatenate(part) for name, part in parts.items()})
+
+
+    def __set_node_arrays(self, arrays):
+        """Store the node arrays returned by `build_nodes` as attributes of the tree."""
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.node_count = len(self.line)
+
+
+    def __init__(self, P, k = 2, eps = 0, leaf_size = 16, workers = 1):
+        """Initialize a FlatKDtree object.
+
+        Parameters:
+            P (array_like): An (n, k) array of points or a list of k-dimensional points.
+            k (int, optional): Number of dimensions. Default is 2.
+            eps (float, optional): Tolerance for zero. Default is 0.
+            leaf_size (int, optional): Maximal number of points stored in a leaf. Default is 16.
+            workers (int, optional): Number of processes building the tree, None for all CPUs. Default is 1.
+
+        Raises:
+            ValueError: If the list of points P is empty or leaf_size is not positive.
+            TypeError: If the points do not match the declared dimension k.
+        """
+        points = np.asarray(P)
+        if points.size == 0: raise ValueError('KDtree cannot be empty!')
+        if points.ndim != 2 or points.shape[1] != k: raise TypeError('Points does not match declared dimension!')
+        if leaf_size < 1: raise ValueError('Leaf size must be positive!')
+
+        self.k = k
+        self.eps = eps
+        self.leaf_size = leaf_size
+        self.points = points
+        self.perm = np.arange(len(points), dtype = np.int64)
+
+        self.__build_kdtree(workers or os.cpu_count() or 1)
+        # bounding box of the whole dataset, used as the region of the root
+        self.lower_bound = points.min(axis = 0).tolist()
+        self.upper_bound = points.max(axis = 0).tolist()
+        # tight bounding boxes of the nodes, computed lazily for batched queries
+        self.node_lower, self.node_upper = None, None
+
+
+    @classmethod
+    def from_kdtree(cls, tree):
+        """Convert an object-based `KDtree` into a FlatKDtree over the same splits.
+
+        Nodes with a single child are skipped (their child takes their place). Both trees keep points
+        with `p[axis] <= line` on the left and points with `p[axis] >= line` on the right.
+
+        Parameters:
+            tree (KDtree): The tree to convert.
+
+        Returns:
+            FlatKDtree: The array-backed tree.
+        """
+        line, axis, left, right, start, end, depth, perm = [], [], [], [], [], [], [], []
+        # (node, depth, parent, is_right_child); a None node closes the range of node number `depth`
+        stack = [(tree.root, 0, -1, False)]
+        while stack:
+            v, d, parent, is_right = stack.pop()
+            if v is None:
+                end[d] = len(perm)
+                continue
+            while (v.left is None) != (v.right is None):
+                v = v.left if v.left is not None else v.right
+                d += 1
+
+            i = len(line)
+            left.append(-1)
+            right.append(-1)
+            start.append(len(perm))
+            end.append(None)
+            depth.append(d)
+            if parent >= 0:
+                if is_right: right[parent] = i
+                else: left[parent] = i
+
+            if v.left is None:
+                perm.extend(v.indices.tolist())
+                end[i] = len(perm)
+                line.append(0)
+                axis.append(0)
+                continue
+            line.append(v.line)
+            axis.append(v.axis)
+            stack.append((None, i, -1, False))
+            stack.append((v.right, d + 1, i, True))
+            stack.append((v.left, d + 1, i, False))
+
+        flat = cls.__new__(cls)
+        flat.k, flat.eps, flat.leaf_size = tree.k, tree.eps, tree.leaf_size
+        flat.points = tree.coords[:tree.n]
+        flat.perm = np.array(perm, dtype = np.int64)
+        flat.line = np.array(line, dtype = flat.points.dtype)
+        flat.axis = np.array(axis, dtype = np.int8)
+        flat.left, flat.right = np.array(left, dtype = np.int64), np.array(right, dtype = np.int64)
+        flat.start, flat.end = np.array(start, dtype = np.int64), np.array(end, dtype = np.int64)
+        flat.depth = np.array(depth, dtype = np.int16)
+        flat.node_count = len(line)
+        used = flat.points[flat.perm]
+        flat.lower_bound, flat.upper_bound = used.min(axis = 0).tolist(), used.max(axis = 0).tolist()
+        flat.node_lower, flat.node_upper = None, None
+        return flat
+
+
+    def save(self, path):
+        """Save the tree to a flat binary file (see `common.index_io.write_index`).
+
+        Parameters:
+            path (str): Path of the file.
+        """
+        if self.node_lower is None: self.__node_boxes()
+
+        meta = {'k': self.k, 'eps': self.eps, 'leaf_size': self.leaf_size, 'node_count': self.node_count,
+                'lower_bound': self.lower_bound, 'upper_bound': self.upper_bound}
+        arrays = {name: getattr(self, name) for name in FlatKDtree.node_arrays}
+        arrays.update(points = self.points, perm = self.perm, node_lower = self.node_lower, node_upper = self.node_upper)
+        write_index(path, FlatKDtree.magic, meta, arrays)
+
+
+    @classmethod
+    def load(cls, path, mmap = True):
+        """Load a tree saved with `save`.
+
+        Parameters:
+            path (str): Path of the file.
+            mmap (bool, optional): Whether to map the file read-only (the tree is usable at once and
+                                   processes loading the same file share its pages). Default is True.
+
+        Returns:
+            FlatKDtree: The loaded tree.
+        """
+        meta, arrays = read_index(path, FlatKDtree.magic, mmap)
+        flat = cls.__new__(cls)
+        flat.k, flat.eps, flat.leaf_size, flat.node_count = meta['k'], meta['eps'], meta['leaf_size'], meta['node_count']
+        flat.lower_bound, flat.upper_bound = meta['lower_bound'], meta['upper_bound']
+        for name, array in arrays.items():
+            setattr(flat, name, array)
+        return flat
+
+
+    def is_leaf(self, v):
+        """Check whether the node with index v is a leaf."""
+        return self.left[v] < 0
+
+
+    def query_indices(self, lower_left, upper_right):
+        """Query the KD-tree for indices (rows of `points`) of the points within the specified region.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+            upper_right (list or tuple): The upper-right corner of the query region.
+
+        Returns:
+            numpy.ndarray: Indices of points that lie within the specified region.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        if len(lower_left) != self.k or len(upper_right) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+
+        lo = [lower_left[i] - self.eps for i in range(self.k)]
+        hi = [upper_right[i] + self.eps for i in range(self.k)]
+        lo_arr, hi_arr = np.array(lo), np.array(hi)
+
+        found = []
+        stack = [(0, self.lower_bound, self.upper_bound)]
+        while stack:
+            v, lower_bound, upper_bound = stack.pop()
+            start, end = self.start[v], self.end[v]
+
+            if all(lo[i] <= lower_bound[i] and upper_bound[i] <= hi[i] for i in range(self.k)):
+                found.append(self.perm[start:end])
+                continue
+
+            if self.left[v] < 0:
+                block = self.perm[start:end]
+                coords = self.points[block]
+                found.append(block[np.all((coords >= lo_arr) & (coords <= hi_arr), axis = 1)])
+                continue
+
+            axis, line = self.axis[v], self.line[v]
+            if lo[axis] <= line:
+                new_upper_bound = list(upper_bound)
+                new_upper_bound[axis] = line
+                stack.append((self.left[v], lower_bound, new_upper_bound))
+            if hi[axis] >= line:
+                new_lower_bound = list(lower_bound)
+                new_lower_bound[axis] = line
+                stack.append((self.right[v], new_lower_bound, upper_bound))
+
+        return np.concatenate(found) if found else np.empty(0, dtype = np.int64)
+
+
+    def query(self, lower_left, upper_right):
+        """Query the KD-tree to find all points within the specified region.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+                                        It should be a k-dimensional point.
+            upper_right (list or tuple): The upper-right corner of the query region.
+                                        It should be a k-dimensional point.
+
+        Returns:
+            list: A list of points (tuples) that lie within the specified region.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        return [tuple(p) for p in self.points[self.query_indices(lower_left, upper_right)].tolist()]
+
+
+    def __count(self, lower_left, upper_right, limit):
+        """Count points within the specified region; subtrees lying within it contribute `end - start` without being walked.
+
+        The search stops as soon as `limit` points have been counted.
+        """
+        if len(lower_left) != self.k or len(upper_right) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+
+        lo = [lower_left[i] - self.eps for i in range(self.k)]
+        hi = [upper_right[i] + self.eps for i in range(self.k)]
+        lo_arr, hi_arr = np.array(lo), np.array(hi)
+
+        count = 0
+        stack = [(0, self.lower_bound, self.upper_bound)]
+        while stack and count < limit:
+            v, lower_bound, upper_bound = stack.pop()
+            start, end = self.start[v], self.end[v]
+
+            if all(lo[i] <= lower_bound[i] and upper_bound[i] <= hi[i] for i in range(self.k)):
+                count += int(end - start)
+                continue
+
+            if self.left[v] < 0:
+                coords = self.points[self.perm[start:end]]
+                count += int(np.count_nonzero(np.all((coords >= lo_arr) & (coords <= hi_arr), axis = 1)))
+                continue
+
+            axis, line = self.axis[v], self.line[v]
+            if lo[axis] <= line:
+                new_upper_bound = list(upper_bound)
+                new_upper_bound[axis] = line
+                stack.append((self.left[v], lower_bound, new_upper_bound))
+            if hi[axis] >= line:
+                new_lower_bound = list(lower_bound)
+                new_lower_bound[axis] = line
+                stack.append((self.right[v], new_lower_bound, upper_bound))
+
+        return count
+
+
+    def count(self, lower_left, upper_right):
+        """Count the points within the specified region without reporting them.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+            upper_right (list or tuple): The upper-right corner of the query region.
+
+        Returns:
+            int: The number of points that lie within the specified region.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        return self.__count(lower_left, upper_right, FlatKDtree.inf)
+
+
+    def any_in(self, lower_left, upper_right):
+        """Check whether any point lies within the specified region, stopping at the first one found.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+            upper_right (list or tuple): The upper-right corner of the query region.
+
+        Returns:
+            bool: True if at least one point lies within the specified region, False otherwise.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        return self.__count(lower_left, upper_right, 1) > 0
+
+
+    def __node_boxes(self):
+        """Compute tight bounding boxes of all nodes: leaves directly from their points, internal nodes from their children."""
+        coords = self.points[self.perm].astype(float)
+        leaves = np.nonzero(self.left < 0)[0]
+        lower, upper = np.empty((self.node_count, self.k)), np.empty((self.node_count, self.k))
+        # leaves in preorder partition perm into consecutive ranges
+        lower[leaves] = np.minimum.reduceat(coords, self.start[leaves])
+        upper[leaves] = np.maximum.reduceat(coords, self.start[leaves])
+        subtree_boxes(np.stack((self.left, self.right), axis = 1), self.depth, lower, upper)
+        self.node_lower, self.node_upper = lower, upper
+
+
+    def query_many(self, lowers, uppers):
+        """Query the KD-tree with many regions at once.
+
+        All queries descend the tree together, level by level (see `common.batched.search_many`),
+        so the per-query Python overhead is paid once per tree level instead of once per node.
+
+        Parameters:
+            lowers (array_like): (m, k) array of lower-left corners of the query regions.
+            uppers (array_like): (m, k) array of upper-right corners of the query regions.
+
+        Returns:
+            tuple: A pair (offsets, indices) in CSR layout - indices (rows of `points`) found
+                   by the i-th query are `indices[offsets[i]:offsets[i + 1]]`.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        lowers, uppers = np.asarray(lowers, dtype = float), np.asarray(uppers, dtype = float)
+        if lowers.ndim != 2 or lowers.shape != uppers.shape or lowers.shape[1] != self.k:
+            raise TypeError('Points does not match declared dimension!')
+
+        if self.node_lower is None: self.__node_boxes()
+
+        return search_many(np.stack((self.left, self.right), axis = 1), self.node_lower, self.node_upper,
+                           self.start, self.end, self.perm, self.points, lowers - self.eps, uppers + self.eps)
+
+
+    def __knn_indices(self, point, k):
+        """Find indices of the k nearest neighbours of a point, together with their squared distances, closest first.
+
+        Nodes are visited depth-first, nearer child first; a node is skipped when the squared distance
+        to its splitting line already exceeds the worst of the k best candidates.
+        """
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if k < 1: raise ValueError('Number of neighbours must be positive!')
+
+        query = np.asarray(point, dtype = float)
+        heap = []
+        # (node, lower bound of the squared distance to its region)
+        stack = [(0, 0.0)]
+        while stack:
+            v, bound = stack.pop()
+            if len(heap) == k and bound >= -heap[0][0]: continue
+
+            if self.left[v] < 0:
+                block = self.perm[self.start[v]:self.end[v]]
+                dists = ((self.points[block] - query) ** 2).sum(axis = 1)
+                for dist, index in zip(dists.tolist(), block.tolist()):
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-dist, index))
+                    elif dist < -heap[0][0]:
+                        heapq.heapreplace(heap, (-dist, index))
+                continue
+
+            diff = point[self.axis[v]] - self.line[v]
+            near, far = (self.left[v], self.right[v]) if diff <= 0 else (self.right[v], self.left[v])
+            # far child first, so that the near one is popped (and tightens the heap) before it
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+
+        return sorted((-dist, index) for dist, index in heap)
+
+
+    def knn(self, point, k):
+        """Find the k nearest neighbours (in the Euclidean metric) of a point.
+
+        Parameters:
+            point (list or tuple): The query point. It should be a k-dimensional point.
+            k (int): Number of neighbours.
+
+        Returns:
+            list: A list of at most k points (tuples), ordered from the closest.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If k is not positive.
+        """
+        return [tuple(self.points[index].tolist()) for _, index in self.__knn_indices(point, k)]
+
+
+    def knn_many(self, points, k):
+        """Find the k nearest neighbours of many points.
+
+        Parameters:
+            points (array_like): (m, k) array of query points.
+            k (int): Number of neighbours.
+
+        Returns:
+            tuple: A pair (distances, indices) of (m, min(k, n)) arrays (n - number of points in the tree) - Euclidean distances to and
+                   indices (rows of `points`) of the neighbours of every query point, ordered from the closest.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+            ValueError: If k is not positive.
+        """
+        points = np.asarray(points, dtype = float)
+        if points.ndim != 2 or points.shape[1] != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if k < 1: raise ValueError('Number of neighbours must be positive!')
+
+        # perm holds only the points in the tree (rows deleted from a converted KDtree stay in `points`)
+        k = min(k, len(self.perm))
+        distances, indices = np.empty((len(points), k)), np.empty((len(points), k), dtype = np.int64)
+        for i, point in enumerate(points.tolist()):
+            found = self.__knn_indices(point, k)
+            distances[i] = np.sqrt([dist for dist, _ in found])
+            indices[i] = [index for _, index in found]
+
+        return distances, indices
+
+
+    def query_radius_indices(self, point, r):
+        """Find indices (rows of `points`) of all points within Euclidean distance r of a point.
+
+        Parameters:
+            point (list or tuple): The centre of the ball. It should be a k-dimensional point.
+            r (float): The radius of the ball.
+
+        Returns:
+            numpy.ndarray: Indices of points that lie within the ball.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If r is negative.
+        """
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if r < 0: raise ValueError('Radius must not be negative!')
+
+        r = r + self.eps
+        query = np.asarray(point, dtype = float)
+        found = []
+        stack = [0]
+        while stack:
+            v = stack.pop()
+            if self.left[v] < 0:
+                block = self.perm[self.start[v]:self.end[v]]
+                found.append(block[((self.points[block] - query) ** 2).sum(axis = 1) <= r * r])
+                continue
+
+            diff = point[self.axis[v]] - self.line[v]
+            if diff <= r: stack.append(self.left[v])
+            if -diff <= r: stack.append(self.right[v])
+
+        return np.concatenate(found) if found else np.empty(0, dtype = np.int64)
+
+
+    def query_radius(self, point, r):
+        """Find all points within Euclidean distance r of a point.
+
+        Parameters:
+            point (list or tuple): The centre of the ball. It should be a k-dimensional point.
+            r (float): The radius of the ball.
+
+        Returns:
+            list: A list of points (tuples) that lie within the ball.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If r is negative.
+        """
+        return [tuple(p) for p in self.points[self.query_radius_indices(point, r)].tolist()]
+
+
+
+if __name__ == '__main__':
+    points_set = [(0, 0), (20, 10), (20, 70), (60, 10), (60, 40), (70, 80), (75, 90), (80, 85), (80, 80), (80, 83)]
+    kdtree = FlatKDtree(points_set, eps=1e-12, leaf_size=2)
+    lower_left = (20, 10)
+    upper_right = (90, 80)
+
+    print(kdtree.query(lower_left, upper_right))
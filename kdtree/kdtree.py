@@ -1,7 +1,23 @@
+import heapq
+import numpy as np
+import os
+from common.arrays import as_point_array
+from common.batched import search_many, subtree_boxes
+from kdtree.flat_kdtree import FlatKDtree
+
+
 class Node:
     """A node in the KD-tree data structure.
+
+    Leaves of a `KDtree` hold a block of point indices (`indices`). Subtrees built in one piece are
+    packed: all their points form one contiguous block, shared with their descendants, so internal
+    nodes of such subtrees keep `indices` too. Updates unpack the nodes they pass (`indices` becomes None).
+
+    Attributes are kept in `__slots__`, so nodes carry no per-instance `__dict__`.
     """
-    def __init__(self, line = None, left = None, right = None, point = None):
+    __slots__ = ('line', 'axis', 'left', 'right', 'point', 'index', 'indices', 'size', 'lower', 'upper')
+
+    def __init__(self, line = None, left = None, right = None, point = None, index = None, indices = None, lower = None, upper = None, axis = None):
         """Initialize a Node in the KD-tree.
 
         Parameters:
@@ -9,167 +25,427 @@ class Node:
             left (Node): The left child node.
             right (Node): The right child node.
             point: The point stored in the node.
+            index (int): Position of the stored point in the list the tree was built from.
+            indices (numpy.ndarray): Indices of the points of the subtree, if they form one block.
+            lower (tuple): The lower corner of the bounding box of the points of the subtree.
+            upper (tuple): The upper corner of the bounding box of the points of the subtree.
+            axis (int): The axis the splitting line is perpendicular to.
         """
         self.line = line
+        self.axis = axis
         self.left = left
         self.right = right
         self.point = point
+        self.index = index
+        self.indices = indices
+        self.lower = lower
+        self.upper = upper
+        # number of points in the subtree
+        if left is None and right is None:
+            self.size = len(indices) if indices is not None else 1
+        else:
+            self.size = (left.size if left is not None else 0) + (right.size if right is not None else 0)
 
-    def report_subtree(self):
+    def report_subtree(self, points = None):
         """Report all points in the subtree rooted at this node.
 
+        Nodes holding a block of indices report the points of the block, other leaves their `point`
+        (nodes built by `KDtreeVisualizer` keep a single point each).
+
+        Parameters:
+            points (list or array_like, optional): The points the indices refer to, e.g. `KDtree.points`
+                                                   (or `KDtree.coords` of a tree built from an array). Default is None.
+
         Returns:
             list: A list of points in the subtree.
         """
-        points = []
-        if self.left is None and self.right is None:
-            points.append(self.point)
-        else:
-            if self.left is not None:
-                points += self.left.report_subtree()
-            if self.right is not None:
-                points += self.right.report_subtree()
+        found, stack = [], [self]
+        while stack:
+            v = stack.pop()
+            if v.indices is not None and points is not None:
+                found += [points[index] for index in v.indices.tolist()]
+                continue
+            if v.left is None and v.right is None:
+                found.append(v.point)
+                continue
+            if v.right is not None: stack.append(v.right)
+            if v.left is not None: stack.append(v.left)
+
+        return found
+
+    def report_indices(self):
+        """Report indices of all points in the subtree rooted at this node.
+
+        Packed subtrees are reported as one slice of their block, without walking their nodes.
+
+        Returns:
+            list: A list of numpy arrays of point indices.
+        """
+        blocks, stack = [], [self]
+        while stack:
+            v = stack.pop()
+            if v.indices is not None:
+                blocks.append(v.indices)
+                continue
+            if v.right is not None: stack.append(v.right)
+            if v.left is not None: stack.append(v.left)
+
+        return blocks
+
+    def report_leaves(self):
+        """Report all leaves in the subtree rooted at this node.
+
+        Returns:
+            list: A list of leaf nodes in the subtree.
+        """
+        leaves, stack = [], [self]
+        while stack:
+            v = stack.pop()
+            if v.left is None and v.right is None:
+                leaves.append(v)
+                continue
+            if v.right is not None: stack.append(v.right)
+            if v.left is not None: stack.append(v.left)
 
-        return points
+        return leaves
 
 class KDtree:
     """KD-tree data structure
     """
     inf = float('inf') # static variable
+    alpha = 0.7 # maximal share of points of a node in one of its children, before the node is rebuilt
+    split_rules = ('round_robin', 'max_spread', 'sliding_midpoint', 'sah')
 
-    def __build_kdtree(self, P, depth):
+    def __build_kdtree(self, perm, start, end, depth):
         """Build the KD-tree recursively.
 
+        Points are split positionally: `__split` reorders the block of the node in place, so that the
+        first points of it go to the left child, and ties on the splitting line cannot unbalance the tree.
+        The blocks of the children are the two parts of the block of their parent, so every node keeps
+        the block and the bounding box of its whole subtree, and no per-axis copies of the points are made.
+
         Parameters:
-            P (list): The k-dimensional list of lists of points sorted by k-dimension to build the tree from.
+            perm (numpy.ndarray): The array of indices of the points, reordered into leaf order.
+            start (int): Position in perm of the first point of the subtree.
+            end (int): Position in perm after the last point of the subtree.
             depth (int): The current depth in the tree.
 
         Returns:
             Node: The root node of the KD-tree.
         """
-        n = len(P[0])
-        if n < 1: return None
-        if n == 1: return Node(point = P[0][0])
-
-        axis = depth % self.k
-        median = P[axis][(n - 1) // 2][axis]
-
-        prep_P_left, prep_P_right = [[] for _ in range(self.k)], [[] for _ in range(self.k)]
+        block = perm[start:end]
+        if end - start <= self.leaf_size:
+            coords = self.coords[block]
+            if end - start == 1: lower = upper = tuple(coords[0].tolist())
+            else: lower, upper = tuple(coords.min(axis = 0).tolist()), tuple(coords.max(axis = 0).tolist())
+            return Node(indices = block, lower = lower, upper = upper)
 
-        for i in range(self.k):
-            for p in P[i]:
-                if p[axis] - median <= self.eps:
-                    prep_P_left[i].append(p)
-                else:
-                    prep_P_right[i].append(p)
+        axis, m, line = self.__split(block, depth)
+        left = self.__build_kdtree(perm, start, start + m, depth + 1)
+        right = self.__build_kdtree(perm, start + m, end, depth + 1)
 
         return Node(
-            line = median,
-            left = self.__build_kdtree(prep_P_left, depth + 1),
-            right = self.__build_kdtree(prep_P_right, depth + 1),
+            line = line,
+            axis = axis,
+            left = left,
+            right = right,
+            indices = block,
+            lower = tuple(map(min, left.lower, right.lower)),
+            upper = tuple(map(max, left.upper, right.upper)),
         )
-    
 
-    def __init__(self, P, k = 2, eps = 0):
+
+    def __partition(self, block, axis, m):
+        """Reorder a block in place (with introselect), so that its first m points have the smallest coordinates along the axis.
+
+        Returns:
+            float: The largest of these m coordinates.
+        """
+        values = self.coords[block, axis]
+        order = np.argpartition(values, m - 1)
+        block[:] = block[order]
+        return float(values[order[m - 1]])
+
+
+    def __split(self, block, depth):
+        """Choose the axis and the position of the split of a node, according to `split_rule`.
+
+        Parameters:
+            block (numpy.ndarray): Indices of the points of the node, reordered in place so that
+                                   the points of the left child come first.
+            depth (int): The depth of the node.
+
+        Returns:
+            tuple: The triple (axis, m, line) - the first m points of the block go to the left child.
+        """
+        n = len(block)
+        if self.split_rule == 'round_robin':
+            axis = depth % self.k
+            m = (n - 1) // 2 + 1
+            return axis, m, self.__partition(block, axis, m)
+
+        # splits leaving more than alpha of the points on one side are not considered,
+        # so the nodes are weight-balanced and updates do not rebuild them at once
+        high = max(1, min(n - 1, int(KDtree.alpha * n)))
+        low = min(n - high, high)
+
+        if self.split_rule == 'sah':
+            best = None
+            m = np.arange(low, high + 1)
+            for axis in range(self.k):
+                order = np.argsort(self.coords[block, axis], kind = 'stable')
+                ordered = block[order]
+                # half-perimeters of the bounding boxes of the first j + 1 and of the last n - j points
+                prefix, suffix = np.zeros(n), np.zeros(n)
+                for i in range(self.k):
+                    values = self.coords[ordered, i]
+                    prefix += np.maximum.accumulate(values) - np.minimum.accumulate(values)
+                    suffix += (np.maximum.accumulate(values[::-1]) - np.minimum.accumulate(values[::-1]))[::-1]
+                cost = m * prefix[m - 1] + (n - m) * suffix[m]
+                j = int(np.argmin(cost))
+                if best is None or cost[j] < best[0]:
+                    best = (cost[j], axis, int(m[j]), float(self.coords[ordered[m[j] - 1], axis]), ordered)
+            _, axis, m, line, ordered = best
+            block[:] = ordered
+            return axis, m, line
+
+        bounds = [(values.min(), values.max()) for values in (self.coords[block, i] for i in range(self.k))]
+        axis = int(np.argmax([upper - lower for lower, upper in bounds]))
+        if self.split_rule == 'max_spread':
+            m = (n - 1) // 2 + 1
+            return axis, m, self.__partition(block, axis, m)
+
+        # sliding midpoint - the line through the middle of the spread slides to the nearest allowed split
+        middle = float(sum(bounds[axis]) / 2)
+        left = self.coords[block, axis] <= middle
+        m = int(np.count_nonzero(left))
+        if low <= m <= high:
+            block[:] = np.concatenate((block[left], block[~left]))
+            return axis, m, middle
+        m = min(max(m, low), high)
+        return axis, m, self.__partition(block, axis, m)
+
+
+    def __build(self, indices, depth):
+        """Build a packed subtree over the given points.
+
+        Parameters:
+            indices (numpy.ndarray): Non-empty array of point indices.
+            depth (int): Depth of the root of the subtree.
+
+        Returns:
+            Node: The root node of the subtree.
+        """
+        return self.__build_kdtree(np.array(indices, dtype = np.int64), 0, len(indices), depth)
+
+
+    def __build_parallel(self, workers):
+        """Build the tree over all points in worker processes and convert it into `Node` objects.
+
+        The splits are computed by the parallel build of `FlatKDtree` (subtrees built by a process pool over
+        shared memory). It splits the block of a node round-robin after its first `(n - 1) // 2 + 1` points,
+        as `__build_kdtree` does, so the tree has the same splits as one built in this process.
+
+        Parameters:
+            workers (int): Number of processes.
+
+        Returns:
+            Node: The root node of the KD-tree.
+        """
+        flat = FlatKDtree(self.coords[:self.n], self.k, self.eps, self.leaf_size, workers)
+        perm, left, right = flat.perm, flat.left.tolist(), flat.right.tolist()
+
+        # tight bounding boxes: leaves from their blocks (ranges of perm in order), internal nodes from their children
+        leaves = np.nonzero(flat.left < 0)[0]
+        leaves = leaves[np.argsort(flat.start[leaves])]
+        lower, upper = np.empty((flat.node_count, self.k)), np.empty((flat.node_count, self.k))
+        coords = self.coords[perm]
+        lower[leaves] = np.minimum.reduceat(coords, flat.start[leaves])
+        upper[leaves] = np.maximum.reduceat(coords, flat.start[leaves])
+        subtree_boxes(np.stack((flat.left, flat.right), axis = 1), flat.depth, lower, upper)
+
+        lines, axes, starts, ends = flat.line.tolist(), flat.axis.tolist(), flat.start.tolist(), flat.end.tolist()
+        lower, upper = list(map(tuple, lower.tolist())), list(map(tuple, upper.tolist()))
+        nodes = [None] * flat.node_count
+        # deepest nodes first, so the children of a node exist before it
+        for v in np.argsort(flat.depth, kind = 'stable')[::-1].tolist():
+            block = perm[starts[v]:ends[v]]
+            if left[v] < 0:
+                nodes[v] = Node(indices = block, lower = lower[v], upper = upper[v])
+            else:
+                nodes[v] = Node(line = lines[v], axis = axes[v], left = nodes[left[v]], right = nodes[right[v]],
+                                indices = block, lower = lower[v], upper = upper[v])
+        return nodes[0]
+
+
+    def __init__(self, P, k = 2, eps = 0, leaf_size = 16, split_rule = 'round_robin', workers = 1):
         """Initialize a KDTree object.
 
+        An (n, k) ndarray of floats (or another buffer-protocol object) is used without copying: the tree
+        refers to its rows by index, `query_indices` and `query_radius_indices` return positions of rows in it,
+        and it is copied only before the first insertion. Point queries then return rows as tuples.
+
         Parameters:
-            P (list): List of points.
+            P (list or array_like): List of points or an (n, k) array of points.
             k (int, optional): Number of dimensions. Default is 2.
             eps (float, optional): Tolerance for zero. Default is 0.
+            leaf_size (int, optional): Maximal number of points stored in a leaf. Default is 16.
+            split_rule (str, optional): How the nodes are split. Default is 'round_robin'.
+                'round_robin' - at the median, along the axes in turn (axis = depth % k),
+                'max_spread' - at the median, along the axis with the widest spread of the points,
+                'sliding_midpoint' - at the middle of the widest spread, slid towards the median
+                                     if it would leave more than `alpha` of the points on one side,
+                'sah' - at the balanced enough split minimizing the sum of the numbers of points
+                        times the half-perimeters of the bounding boxes of both sides.
+            workers (int, optional): Number of processes building the tree, None for all CPUs. Default is 1.
+                                     Only the 'round_robin' rule is built in parallel, and only the initial
+                                     build (subtrees rebuilt by updates are built in this process).
 
         Raises:
-            ValueError: If the list of points P is empty.
+            ValueError: If the list of points P is empty, leaf_size is not positive, split_rule is unknown
+                        or workers is not 1 for another split rule than 'round_robin'.
             TypeError: If the points do not match the declared dimension k.
         """
-        if not P: raise ValueError('KDtree cannot be empty!')
-        if len(P[0]) != k: raise TypeError('Points does not match declared dimension!')
+        coords = as_point_array(P, k)
+        if coords is None:
+            if not P: raise ValueError('KDtree cannot be empty!')
+            if len(P[0]) != k: raise TypeError('Points does not match declared dimension!')
+        elif len(coords) == 0: raise ValueError('KDtree cannot be empty!')
+        if leaf_size < 1: raise ValueError('Leaf size must be positive!')
+        if split_rule not in KDtree.split_rules: raise ValueError('Unknown split rule!')
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and split_rule != 'round_robin': raise ValueError('Parallel build supports only the round_robin split rule!')
 
         self.k = k
         self.eps = eps
+        self.leaf_size = leaf_size
+        self.split_rule = split_rule
+        # the points as given (None for array input, whose points are the rows of coords)
+        self.points = list(P) if coords is None else None
+        # coordinates of the points as rows (with spare rows for inserted points)
+        self.coords = np.array(P, dtype = float).reshape(len(P), k) if coords is None else coords
+        # number of used rows of coords (indices of all points ever added)
+        self.n = len(self.coords)
+
+        self.root = self.__build(np.arange(self.n), 0) if workers == 1 else self.__build_parallel(workers)
+        # number of nodes visited by the last range, kNN or radius search
+        self.visited = 0
+        # QueryStats tracing range queries, None when tracing is off
+        self.stats = None
+        # node arrays for batched queries, built lazily
+        self.__flat = None
 
-        preprocessed_P = [sorted(P, key = lambda x:x[i]) for i in range(k)]
-        
-        self.root = self.__build_kdtree(preprocessed_P, 0)
 
+    def __search_kdtree(self, lower_left, upper_right, report, limit = None, record = None):
+        """Search the KD-tree for points within a specified range, with an explicit stack.
 
-    def __contains(self, lower_bound, upper_bound, lower_left, upper_right):
-        """Check if the current region is within the given bounds.
+        Every node is tested against the range once, using the bounding box of its points: disjoint subtrees
+        are skipped, subtrees within the range are reported (or counted) whole, leaf blocks are
+        checked with one vectorized test and the children of other nodes are searched.
 
         Parameters:
-            lower_bound (list or tuple): The lower bound coordinates.
-            upper_bound (list or tuple): The upper bound coordinates.
-            lower_left (list or tuple): The lower-left coordinates of the node.
-            upper_right (list or tuple): The upper-right coordinates of the node.
+            lower_left (list or tuple): The lower bounds of the search range.
+            upper_right (list or tuple): The upper bounds of the search range.
+            report (bool): Whether to collect the indices of the points found or only count them.
+            limit (float, optional): The search stops as soon as this many points have been counted. Default is no limit.
+            record (dict, optional): The record of a traced query, opened by `QueryStats.start`, receiving
+                                     the steps of the search. Default is None (nothing is recorded).
 
         Returns:
-            bool: True if the region is within the bounds, False otherwise.
+            tuple: A pair (found, count) - a list of arrays of indices of points within the range
+                   (empty if report is False) and their number (at least limit if the search stopped early).
         """
-        return all(lower_left[i] - lower_bound[i] <= self.eps for i in range(self.k)) and all(upper_right[i] - upper_bound[i] >= -self.eps for i in range(self.k))
-    
+        lo = [lower_left[i] - self.eps for i in range(self.k)]
+        hi = [upper_right[i] + self.eps for i in range(self.k)]
+        lo_arr, hi_arr = np.array(lo), np.array(hi)
+        if limit is None: limit = KDtree.inf
+
+        found, count = [], 0
+        visited, pruned, reported, tested = 0, 0, 0, 0
+        stack = [self.root]
+        while stack and count < limit:
+            v = stack.pop()
+            visited += 1
+            # fused test: the loop breaks on the first axis separating the box from the range
+            inside = True
+            for lower, upper, a, b in zip(v.lower, v.upper, lo, hi):
+                if upper < a or lower > b:
+                    pruned += 1
+                    break
+                if lower < a or upper > b: inside = False
+            else:
+                if inside:
+                    reported += 1
+                    if report: found += v.report_indices()
+                    count += v.size
+                elif v.left is None and v.right is None:
+                    tested += v.size
+                    coords = self.coords[v.indices]
+                    mask = np.all((coords >= lo_arr) & (coords <= hi_arr), axis = 1)
+                    if report: found.append(v.indices[mask])
+                    count += int(np.count_nonzero(mask))
+                else:
+                    if v.right is not None: stack.append(v.right)
+                    if v.left is not None: stack.append(v.left)
 
-    def __intersects(self, lower_bound, upper_bound, lower_left, upper_right):
-        """Check if two regions intersect.
+        self.visited = visited
+        if record is not None:
+            record['visited'] += visited
+            record['pruned'] += pruned
+            record['reported_subtrees'] += reported
+            record['points_tested'] += tested
+        return found, count
+
+
+    def __range_search(self, kind, lower_left, upper_right, report, limit = None):
+        """Run a range search, traced if statistics are attached to the tree (`stats`).
 
         Parameters:
-            lower_bound (list or tuple): The lower bounds of the first region in each dimension.
-            upper_bound (list or tuple): The upper bounds of the first region in each dimension.
-            lower_left (list or tuple): The lower bounds of the second region in each dimension.
-            upper_right (list or tuple): The upper bounds of the second region in each dimension.
+            kind (str): The name of the query method, stored in the record of the query.
+            lower_left (list or tuple): The lower bounds of the search range.
+            upper_right (list or tuple): The upper bounds of the search range.
+            report (bool): Whether to collect the indices of the points found or only count them.
+            limit (float, optional): The search stops as soon as this many points have been counted. Default is no limit.
 
         Returns:
-            bool: True if the regions intersect, False otherwise.
+            tuple: A pair (found, count) as in `__search_kdtree`.
         """
-        for i in range(self.k):
-            if upper_bound[i] - lower_left[i] < -self.eps or lower_bound[i] - upper_right[i] > self.eps:
-                return False
-        return True
-    
-    
-    def __search_kdtree(self, v : Node, lower_bound : list, upper_bound : list, lower_left, upper_right, depth):
-        """Recursively searches the KD-tree for points within a specified range.
+        if len(lower_left) != self.k or len(upper_right) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if self.stats is None: return self.__search_kdtree(lower_left, upper_right, report, limit)
+
+        record = self.stats.start(kind)
+        found, count = self.__search_kdtree(lower_left, upper_right, report, limit, record)
+        self.stats.finish(record, count)
+        return found, count
+
+
+    def __report(self, indices):
+        """Return the points of the given indices - as given to the tree, or as tuples of coordinates for array input."""
+        if self.points is None: return list(map(tuple, self.coords[indices].tolist()))
+        return [self.points[index] for index in indices.tolist()]
+
+
+    def query_indices(self, lower_left, upper_right):
+        """Query the KD-tree to find indices of all points within the specified region.
 
         Parameters:
-            v (Node): The current node in the KD-tree.
-            lower_bound (list): The lower bounds of the current region.
-            upper_bound (list): The upper bounds of the current region.
-            lower_left (list or tuple): The lower bounds of the search range.
-            upper_right (list or tuple): The upper bounds of the search range.
-            depth (int): The current depth in the KD-tree.
+            lower_left (list or tuple): The lower-left corner of the query region.
+                                        It should be a k-dimensional point.
+            upper_right (list or tuple): The upper-right corner of the query region.
+                                        It should be a k-dimensional point.
 
         Returns:
-            list: A list of points within the specified range.
+            numpy.ndarray: Indices of the points (positions in the list or rows of the array
+                           the tree was built from; inserted points follow them) within the region.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
         """
-        if v.left is None and v.right is None:
-            return [v.point] if all(lower_left[i] - self.eps <= v.point[i] <= upper_right[i] + self.eps for i in range(self.k)) else []
-
-        axis = depth % self.k
-        points = []
-        
-        # left region
-        if v.left is not None:
-            old = upper_bound[axis]
-            upper_bound[axis] = v.line
-            if self.__contains(lower_bound, upper_bound, lower_left, upper_right):
-                points += v.left.report_subtree()
-            elif self.__intersects(lower_bound, upper_bound, lower_left, upper_right):
-                points += self.__search_kdtree(v.left, lower_bound, upper_bound, lower_left, upper_right, depth + 1)
-            # backtracking
-            upper_bound[axis] = old
-
-        # right region
-        if v.right is not None:
-            old = lower_bound[axis]
-            lower_bound[axis] = v.line
-            if self.__contains(lower_bound, upper_bound, lower_left, upper_right):
-                points += v.right.report_subtree()
-            elif self.__intersects(lower_bound, upper_bound, lower_left, upper_right):
-                points += self.__search_kdtree(v.right, lower_bound, upper_bound, lower_left, upper_right, depth + 1)
-            # backtracking
-            lower_bound[axis] = old
-
-        return points
-    
+        found, _ = self.__range_search('query', lower_left, upper_right, True)
+        return np.concatenate(found) if found else np.empty(0, dtype = np.int64)
+
 
     def query(self, lower_left, upper_right):
         """Query the KD-tree to find all points within the specified region.
@@ -187,14 +463,560 @@ class KDtree:
             TypeError: If the dimensions of the provided points do not match the 
                     dimension of the KD-tree.
         """
-        if len(lower_left) != len(upper_right) != self.k:
+        return self.__report(self.query_indices(lower_left, upper_right))
+
+
+    def count(self, lower_left, upper_right):
+        """Count the points within the specified region without reporting them.
+
+        Subtrees whose bounding box lies within the range contribute their stored size without being walked.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+            upper_right (list or tuple): The upper-right corner of the query region.
+
+        Returns:
+            int: The number of points that lie within the specified region.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        return self.__range_search('count', lower_left, upper_right, False)[1]
+
+
+    def any_in(self, lower_left, upper_right):
+        """Check whether any point lies within the specified region, stopping at the first one found.
+
+        Parameters:
+            lower_left (list or tuple): The lower-left corner of the query region.
+            upper_right (list or tuple): The upper-right corner of the query region.
+
+        Returns:
+            bool: True if at least one point lies within the specified region, False otherwise.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        return self.__range_search('any_in', lower_left, upper_right, False, 1)[1] > 0
+
+
+    def __flatten(self):
+        """Flatten the tree into node arrays used by batched queries.
+
+        Nodes are numbered in preorder and leaves are listed left to right, so every node covers
+        a contiguous range of the leaf order. Node boxes are the tight bounding boxes of their points.
+
+        Returns:
+            tuple: Arrays (children, lower, upper, start, end, order, coords) as expected by `search_many`.
+        """
+        children, start, end, depth, order = [], [], [], [], []
+        # (node, depth, parent, child slot)
+        stack = [(self.root, 0, -1, 0)]
+        while stack:
+            v, d, parent, slot = stack.pop()
+            if v is None:
+                end[d] = len(order)
+                continue
+            i = len(children)
+            children.append([-1, -1])
+            depth.append(d)
+            start.append(len(order))
+            end.append(None)
+            if parent >= 0: children[parent][slot] = i
+
+            if v.left is None and v.right is None:
+                order.extend(v.indices.tolist())
+                end[i] = len(order)
+                continue
+            # a marker closing the range of the node once its subtree has been numbered
+            stack.append((None, i, -1, 0))
+            if v.right is not None: stack.append((v.right, d + 1, i, 1))
+            if v.left is not None: stack.append((v.left, d + 1, i, 0))
+
+        children, depth = np.array(children, dtype = np.int64), np.array(depth)
+        start, end, order = np.array(start, dtype = np.int64), np.array(end, dtype = np.int64), np.array(order, dtype = np.int64)
+        coords = self.coords[:self.n]
+        lower, upper = np.empty((len(children), self.k)), np.empty((len(children), self.k))
+        leaf = np.all(children < 0, axis = 1)
+        # leaves cover consecutive ranges of the leaf order
+        lower[leaf] = np.minimum.reduceat(coords[order], start[leaf])
+        upper[leaf] = np.maximum.reduceat(coords[order], start[leaf])
+        subtree_boxes(children, depth, lower, upper)
+
+        return children, lower, upper, start, end, order, coords
+
+
+    def query_many(self, lowers, uppers):
+        """Query the KD-tree with many regions at once.
+
+        The tree is flattened into node arrays on the first call and all queries descend it
+        together, level by level (see `common.batched.search_many`).
+
+        Parameters:
+            lowers (array_like): (m, k) array of lower-left corners of the query regions.
+            uppers (array_like): (m, k) array of upper-right corners of the query regions.
+
+        Returns:
+            tuple: A pair (offsets, indices) in CSR layout - indices of points (positions in the list
+                   the tree was built from) found by the i-th query are `indices[offsets[i]:offsets[i + 1]]`.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+        """
+        lowers, uppers = np.asarray(lowers, dtype = float), np.asarray(uppers, dtype = float)
+        if lowers.ndim != 2 or lowers.shape != uppers.shape or lowers.shape[1] != self.k:
             raise TypeError('Points does not match declared dimension!')
-        
-        # region represented as two k-dimensional boundary points
-        lower_bound, upper_bound = [-KDtree.inf] * self.k, [KDtree.inf] * self.k
 
-        return self.__search_kdtree(self.root, lower_bound, upper_bound, lower_left, upper_right, 0)
-    
+        if self.__flat is None: self.__flat = self.__flatten()
+
+        return search_many(*self.__flat, lowers - self.eps, uppers + self.eps)
+
+
+    def save(self, path):
+        """Save the tree to a flat binary file.
+
+        The file holds the same splits in the array layout of `FlatKDtree` and can be memory-mapped by `KDtree.load`.
+
+        Parameters:
+            path (str): Path of the file.
+        """
+        FlatKDtree.from_kdtree(self).save(path)
+
+
+    @staticmethod
+    def load(path, mmap = True):
+        """Load a tree saved with `save`, without rebuilding or deserializing it.
+
+        Parameters:
+            path (str): Path of the file.
+            mmap (bool, optional): Whether to map the file read-only instead of reading it into memory. Default is True.
+
+        Returns:
+            FlatKDtree: The loaded tree, answering the same queries as `KDtree`.
+        """
+        return FlatKDtree.load(path, mmap)
+
+
+    def __distances(self, v : Node, point):
+        """Compute the squared distances from a point to the nearest and to the farthest point of the bounding box of a node.
+
+        Parameters:
+            v (Node): The node.
+            point (list or tuple): The point.
+
+        Returns:
+            tuple: The pair (near, far) of squared distances; near is decreased by eps on every axis.
+        """
+        near = far = 0
+        for lower, upper, c in zip(v.lower, v.upper, point):
+            gap = max(lower - c, c - upper) - self.eps
+            if gap > 0: near += gap * gap
+            far += max(c - lower, upper - c) ** 2
+        return near, far
+
+
+    def __knn_search(self, point, k):
+        """Search the KD-tree for the k nearest neighbours of a point (branch and bound, with an explicit stack).
+
+        The child on the side of the splitting line holding the point is searched first. The other child
+        is at least as far as the splitting line, and a node is skipped once that bound is not closer than
+        the k-th best candidate found so far. Leaf points farther than that candidate are skipped with one vectorized test.
+
+        Parameters:
+            point (list or tuple): The query point.
+            k (int): Number of neighbours searched for.
+
+        Returns:
+            list: Max-heap (by negated squared distance) of pairs (-distance, index) of the k best candidates.
+        """
+        heap, visited = [], 0
+        # pairs (lower bound of the squared distance to the points of a node, node)
+        stack = [(0, self.root)]
+        while stack:
+            gap, v = stack.pop()
+            if len(heap) == k and gap >= -heap[0][0]: continue
+            visited += 1
+
+            if v.left is None and v.right is None:
+                dists = np.sum((self.coords[v.indices] - point) ** 2, axis = 1)
+                indices = v.indices
+                if len(heap) == k:
+                    closer = dists < -heap[0][0]
+                    dists, indices = dists[closer], indices[closer]
+                for dist, index in zip(dists.tolist(), indices.tolist()):
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-dist, index))
+                    elif dist < -heap[0][0]:
+                        heapq.heapreplace(heap, (-dist, index))
+                continue
+
+            diff = point[v.axis] - v.line
+            near, far = (v.left, v.right) if diff <= 0 else (v.right, v.left)
+            line_gap = max(abs(diff) - self.eps, 0)
+            # the near child is pushed last, so it is searched first
+            if far is not None: stack.append((max(gap, line_gap * line_gap), far))
+            if near is not None: stack.append((gap, near))
+
+        self.visited = visited
+        return heap
+
+
+    def __knn_indices(self, point, k):
+        """Find indices of the k nearest neighbours of a point, together with their squared distances, closest first."""
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if k < 1: raise ValueError('Number of neighbours must be positive!')
+
+        return sorted((-dist, index) for dist, index in self.__knn_search(point, k))
+
+
+    def knn(self, point, k):
+        """Find the k nearest neighbours (in the Euclidean metric) of a point.
+
+        Parameters:
+            point (list or tuple): The query point. It should be a k-dimensional point.
+            k (int): Number of neighbours.
+
+        Returns:
+            list: A list of at most k points, ordered from the closest.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If k is not positive.
+        """
+        return self.__report(np.array([index for _, index in self.__knn_indices(point, k)], dtype = np.int64))
+
+
+    def knn_many(self, points, k):
+        """Find the k nearest neighbours of many points.
+
+        Parameters:
+            points (array_like): (m, k) array of query points.
+            k (int): Number of neighbours.
+
+        Returns:
+            tuple: A pair (distances, indices) of (m, min(k, n)) arrays - Euclidean distances to and
+                   indices (positions in the list the tree was built from) of the neighbours of every
+                   query point, ordered from the closest.
+
+        Raises:
+            TypeError: If the dimensions of the provided points do not match the
+                    dimension of the KD-tree.
+            ValueError: If k is not positive.
+        """
+        points = np.asarray(points, dtype = float)
+        if points.ndim != 2 or points.shape[1] != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if k < 1: raise ValueError('Number of neighbours must be positive!')
+
+        k = min(k, self.root.size)
+        distances, indices = np.empty((len(points), k)), np.empty((len(points), k), dtype = np.int64)
+        for i, point in enumerate(points.tolist()):
+            found = self.__knn_indices(point, k)
+            distances[i] = np.sqrt([dist for dist, _ in found])
+            indices[i] = [index for _, index in found]
+
+        return distances, indices
+
+
+    def __radius_search(self, point, r):
+        """Search the KD-tree for indices of points within distance r of a point, with an explicit stack.
+
+        Subtrees whose bounding box lies within the ball are reported whole.
+
+        Parameters:
+            point (list or tuple): The query point.
+            r (float): The search radius, already increased by eps.
+
+        Returns:
+            list: A list of arrays of indices of points within the radius.
+        """
+        found, stack, visited = [], [self.root], 0
+        while stack:
+            v = stack.pop()
+            visited += 1
+            near, far = self.__distances(v, point)
+            if near > r * r: continue
+            if far <= r * r:
+                found += v.report_indices()
+            elif v.left is None and v.right is None:
+                found.append(v.indices[np.sum((self.coords[v.indices] - point) ** 2, axis = 1) <= r * r])
+            else:
+                if v.right is not None: stack.append(v.right)
+                if v.left is not None: stack.append(v.left)
+
+        self.visited = visited
+        return found
+
+
+    def query_radius_indices(self, point, r):
+        """Find indices of all points within Euclidean distance r of a point.
+
+        Parameters:
+            point (list or tuple): The centre of the ball. It should be a k-dimensional point.
+            r (float): The radius of the ball.
+
+        Returns:
+            numpy.ndarray: Indices of the points (positions in the list or rows of the array
+                           the tree was built from) within the ball.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If r is negative.
+        """
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+        if r < 0: raise ValueError('Radius must not be negative!')
+
+        found = self.__radius_search(point, r + self.eps)
+        return np.concatenate(found) if found else np.empty(0, dtype = np.int64)
+
+
+    def query_radius(self, point, r):
+        """Find all points within Euclidean distance r of a point.
+
+        Parameters:
+            point (list or tuple): The centre of the ball. It should be a k-dimensional point.
+            r (float): The radius of the ball.
+
+        Returns:
+            list: A list of points that lie within the ball.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If r is negative.
+        """
+        return self.__report(self.query_radius_indices(point, r))
+
+
+    def __rebalance(self, path):
+        """Rebuild the highest subtree on a path which is no longer weight-balanced (scapegoat).
+
+        A node is balanced if none of its children holds more than `alpha` of its points,
+        which keeps the height of the tree logarithmic.
+
+        Parameters:
+            path (list): Pairs (node, depth) from the root down to the node that was updated.
+        """
+        for i, (v, depth) in enumerate(path):
+            heavier = max(v.left.size if v.left is not None else 0, v.right.size if v.right is not None else 0)
+            if heavier <= KDtree.alpha * v.size: continue
+
+            self.__replace(path, i, self.__build(np.concatenate(v.report_indices()), depth))
+            return
+
+
+    def __replace(self, path, i, node):
+        """Put a node in place of the i-th node of a path from the root."""
+        if i == 0:
+            self.root = node
+            return
+        parent, v = path[i - 1][0], path[i][0]
+        if parent.left is v: parent.left = node
+        else: parent.right = node
+
+
+    def insert(self, point):
+        """Insert a point into the KD-tree.
+
+        The point gets the next index (it is appended to `points` of a list-built tree) and is added to the block of its leaf;
+        a leaf exceeding `leaf_size` points is split. Subtrees that become unbalanced are rebuilt,
+        so the cost of an insertion is amortized O(log^2 n).
+
+        Parameters:
+            point (list or tuple): The point to insert. It should be a k-dimensional point.
+
+        Returns:
+            int: Index of the inserted point.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+        """
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+
+        index = self.n
+        # a full array is reallocated, so an array given to the constructor is never written to
+        if index == len(self.coords):
+            self.coords = np.concatenate((self.coords, np.empty_like(self.coords)))
+        self.coords[index] = point
+        self.n += 1
+        if self.points is not None: self.points.append(point)
+        self.__flat = None
+
+        path = []
+        v, depth = self.root, 0
+        while v.left is not None or v.right is not None:
+            path.append((v, depth))
+            v.size += 1
+            # the block of the subtree no longer holds all its points
+            v.indices = None
+            v.lower, v.upper = tuple(map(min, v.lower, point)), tuple(map(max, v.upper, point))
+            side = 'left' if point[v.axis] <= v.line else 'right'
+            if getattr(v, side) is None:
+                setattr(v, side, Node(indices = np.array([index]), lower = tuple(point), upper = tuple(point)))
+                break
+            v, depth = getattr(v, side), depth + 1
+        else:
+            path.append((v, depth))
+            v.lower, v.upper = tuple(map(min, v.lower, point)), tuple(map(max, v.upper, point))
+            v.indices = np.append(v.indices, index)
+            v.size += 1
+            if v.size > self.leaf_size:
+                self.__replace(path, len(path) - 1, self.__build(v.indices, depth))
+                path.pop()
+
+        self.__rebalance(path)
+        return index
+
+
+    def __delete_kdtree(self, v : Node, point, depth):
+        """Recursively searches the subtree of a node for a point and removes it from the block of its leaf.
+
+        Nodes left without points are removed as well.
+
+        Parameters:
+            v (Node): The current node in the KD-tree.
+            point (list or tuple): The point to remove.
+            depth (int): The current depth in the KD-tree.
+
+        Returns:
+            list: Pairs (node, depth) from v down to the leaf of the removed point, or None if the point was not found.
+        """
+        if v.left is None and v.right is None:
+            match = np.flatnonzero(np.all(np.abs(self.coords[v.indices] - point) <= self.eps, axis = 1))
+            if len(match) == 0: return None
+            v.indices = np.delete(v.indices, match[0])
+            v.size -= 1
+            return [(v, depth)]
+
+        axis = v.axis
+        # the point may lie on the splitting line, so both sides are searched then
+        for child, side in ((v.left, 'left'), (v.right, 'right')):
+            if child is None: continue
+            if side == 'left' and point[axis] - v.line > self.eps: continue
+            if side == 'right' and v.line - point[axis] > self.eps: continue
+
+            path = self.__delete_kdtree(child, point, depth + 1)
+            if path is None: continue
+            if child.size == 0:
+                setattr(v, side, None)
+                path = []
+
+            v.size -= 1
+            v.indices = None
+            return [(v, depth)] + path
+        return None
+
+
+    def delete(self, point):
+        """Remove one occurrence of a point from the KD-tree.
+
+        Subtrees that become unbalanced are rebuilt, so the cost of a deletion is amortized O(log^2 n).
+        Indices of the remaining points do not change until removed points take more than half of the rows
+        of `coords`; the tree is then compacted (see `__compact`). Bounding boxes of the nodes are not shrunk,
+        they still hold all points of their subtrees until the subtrees are rebuilt.
+
+        Parameters:
+            point (list or tuple): The point to remove. It should be a k-dimensional point.
+
+        Returns:
+            bool: True if the point was found and removed, False otherwise.
+
+        Raises:
+            TypeError: If the dimension of the provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If the point is the last one in the tree.
+        """
+        if len(point) != self.k:
+            raise TypeError('Points does not match declared dimension!')
+
+        if self.root.size == 1:
+            last = self.root.report_indices()[0][0]
+            if any(abs(self.coords[last, i] - point[i]) > self.eps for i in range(self.k)): return False
+            raise ValueError('KDtree cannot be empty!')
+
+        path = self.__delete_kdtree(self.root, point, 0)
+        if path is None: return False
+
+        self.__flat = None
+        if 2 * self.root.size < self.n:
+            self.__compact(np.concatenate(self.root.report_indices()))
+        else:
+            self.__rebalance(path)
+        return True
+
+
+    def __compact(self, kept, add = ()):
+        """Rebuild the whole tree from the points of the given indices and new points, dropping the rows of removed points.
+
+        The kept points are renumbered 0, 1, ... in the order of their old indices and the new points follow them,
+        so indices returned before (and rows of an array the tree was built from) no longer refer to the same points.
+
+        Parameters:
+            kept (numpy.ndarray): Indices of the points staying in the tree.
+            add (list, optional): New points. Default is empty.
+        """
+        kept = np.sort(kept)
+        coords = self.coords[kept]
+        if len(add): coords = np.concatenate((coords, np.array(add, dtype = float).reshape(-1, self.k)))
+        if self.points is not None: self.points = [self.points[index] for index in kept.tolist()] + list(add)
+        self.coords, self.n = coords, len(coords)
+        self.root = self.__build(np.arange(self.n), 0)
+        self.__flat = None
+
+
+    def bulk_update(self, add = (), remove = ()):
+        """Remove and insert many points at once.
+
+        Small batches are applied point by point. A batch changing more than half of the tree
+        rebuilds it from scratch instead, which is cheaper than that many rebalancing updates;
+        removals match points within eps, as in `delete`, and the tree is compacted (see `__compact`).
+
+        Parameters:
+            add (list, optional): Points to insert. Default is empty.
+            remove (list, optional): Points to remove (one occurrence per entry). Default is empty.
+
+        Returns:
+            int: Number of points found and removed.
+
+        Raises:
+            TypeError: If the dimension of any provided point does not match the
+                    dimension of the KD-tree.
+            ValueError: If the tree would become empty.
+        """
+        if any(len(point) != self.k for point in list(add) + list(remove)):
+            raise TypeError('Points does not match declared dimension!')
+
+        if 2 * (len(add) + len(remove)) <= self.root.size:
+            removed = sum(self.delete(point) for point in remove)
+            for point in add: self.insert(point)
+            return removed
+
+        # every removal takes one not yet removed point within eps of it (the box search widens the range by eps)
+        dead, removed = np.zeros(self.n, dtype = bool), 0
+        for point in remove:
+            found, _ = self.__search_kdtree(point, point, True)
+            for indices in found:
+                free = indices[~dead[indices]]
+                if len(free):
+                    dead[free[0]] = True
+                    removed += 1
+                    break
+
+        indices = np.concatenate(self.root.report_indices())
+        kept = indices[~dead[indices]]
+        if len(kept) + len(add) == 0: raise ValueError('KDtree cannot be empty!')
+        self.__compact(kept, add)
+        return removed
+
 
 
 if __name__ == '__main__':
@@ -1,4 +1,8 @@
+import numpy as np
+import os
+import tempfile
 from kdtree.kdtree import KDtree
+from kdtree.flat_kdtree import FlatKDtree
 
 # krotki (P, (lower_left, upper_right), result)
 a = ([(0, 20), (-20, -20), (20, 20), (20, 0), (-20, 0), (0, -20)], ((0, -20), (20, 20)), [(0, -20), (0, 20), (20, 0), (20, 20)])
@@ -14,14 +18,117 @@ j = ([(1.1, 2.2, 3.3), (4.4, 5.5, 6.6), (7.7, 8.8, 9.9), (10.0, 11.1, 12.2)], ((
 
 tests = [a, b, c, d, e, f, g, h, i, j]
 
+# krotki (P, point, k, wynik knn) oraz (P, point, r, wynik query_radius)
+knn_tests = [(b[0], (78, 82), 3, [(80, 83), (80, 80), (80, 85)]), (d[0], (5, 6, 7), 2, [(4, 5, 6), (7, 8, 9)])]
+radius_tests = [(c[0], (5, 5), 1.5, [(4, 6), (5, 5), (6, 4)]), (j[0], (4, 5, 6), 1.5, [(4.4, 5.5, 6.6)])]
+
 def runtests():
     for i in range(len(tests)):
         P, R, res = tests[i]
         kd = KDtree(P, len(P[0]), 1e-12)
-        if sorted(kd.query(*R)) == res:
+        small = [KDtree(P, len(P[0]), 1e-12, leaf_size = 1, split_rule = rule) for rule in KDtree.split_rules]
+        flat = FlatKDtree(P, len(P[0]), 1e-12, leaf_size = 2)
+        if sorted(kd.query(*R)) == res and all(sorted(tree.query(*R)) == res for tree in small) and sorted(flat.query(*R)) == res:
             print(f"Test {i}: zaliczony!")
         else:
             print(f"Test {i}: niezaliczony!!!")
 
+    for i in range(len(knn_tests)):
+        P, point, k, res = knn_tests[i]
+        kd = KDtree(P, len(P[0]), 1e-12, leaf_size = 1)
+        flat = FlatKDtree(P, len(P[0]), 1e-12, leaf_size = 2)
+        if kd.knn(point, k) == res and flat.knn(point, k) == res:
+            print(f"Test knn {i}: zaliczony!")
+        else:
+            print(f"Test knn {i}: niezaliczony!!!")
+
+    for i in range(len(radius_tests)):
+        P, point, r, res = radius_tests[i]
+        kd = KDtree(P, len(P[0]), 1e-12, leaf_size = 1)
+        flat = FlatKDtree(P, len(P[0]), 1e-12, leaf_size = 2)
+        if sorted(kd.query_radius(point, r)) == res and sorted(flat.query_radius(point, r)) == res:
+            print(f"Test query_radius {i}: zaliczony!")
+        else:
+            print(f"Test query_radius {i}: niezaliczony!!!")
+
+    # report_subtree zwraca punkty z blokow indeksow lisci, takze po wstawieniu punktow
+    for i in range(len(tests)):
+        P = tests[i][0]
+        kd = KDtree(P[:-1], len(P[0]), 1e-12, leaf_size = 1)
+        kd.insert(P[-1])
+        if sorted(kd.root.report_subtree(kd.points)) == sorted(P) and sorted(kd.root.left.report_subtree(kd.points) + kd.root.right.report_subtree(kd.points)) == sorted(P):
+            print(f"Test report_subtree {i}: zaliczony!")
+        else:
+            print(f"Test report_subtree {i}: niezaliczony!!!")
+
+    # ujemny promien jest odrzucany
+    for tree in (KDtree(c[0]), FlatKDtree(c[0])):
+        try:
+            tree.query_radius((5, 5), -1)
+            print("Test ujemnego promienia: niezaliczony!!!")
+        except ValueError:
+            print("Test ujemnego promienia: zaliczony!")
+
+    # drzewo budowane z jednego punktu przez insert, a nastepnie oprozniane z wyniku przez delete
+    for i in range(len(tests)):
+        P, (lower_left, upper_right), res = tests[i]
+        kd = KDtree(P[:1], len(P[0]), 1e-12, leaf_size = 2)
+        for point in P[1:]: kd.insert(point)
+        found = sorted(kd.query(lower_left, upper_right))
+        removed = all(kd.delete(point) for point in res if point != P[0])
+        if found == res and sorted(kd.query(lower_left, upper_right)) == [point for point in res if point == P[0]] and removed:
+            print(f"Test insert/delete {i}: zaliczony!")
+        else:
+            print(f"Test insert/delete {i}: niezaliczony!!!")
+
+    # drzewo budowane bez kopiowania z tablicy punktow
+    for i in range(len(tests)):
+        P, R, res = tests[i]
+        array = np.array(P, dtype = float)
+        kd = KDtree(array, len(P[0]), 1e-12, leaf_size = 1)
+        indices = kd.query_indices(*R)
+        if np.shares_memory(kd.coords, array) and sorted(kd.query(*R)) == res and sorted(P[index] for index in indices) == res:
+            print(f"Test tablicy {i}: zaliczony!")
+        else:
+            print(f"Test tablicy {i}: niezaliczony!!!")
+
+    # usuwanie punktow bliskich (w granicach eps) zapisanym - ten sam wynik dla malych i duzych partii
+    P = [(x, y) for x in range(10) for y in range(10)]
+    near = [(x + 0.05, y - 0.05) for x, y in P[:60]]
+    results = []
+    for remove in ([near[:10]], [near]):
+        kd = KDtree(P, 2, 0.1, leaf_size = 2)
+        removed = sum(kd.bulk_update(remove = batch) for batch in remove)
+        results.append((removed, sorted(kd.query((0, 0), (9, 9)))))
+    if results[0] == (10, P[10:]) and results[1] == (60, P[60:]):
+        print("Test bulk_update z eps: zaliczony!")
+    else:
+        print("Test bulk_update z eps: niezaliczony!!!")
+
+    # wielokrotne wstawianie i usuwanie nie moze powiekszac tablicy wspolrzednych bez ograniczen
+    kd = KDtree(P, 2, 1e-12, leaf_size = 2)
+    for step in range(2000):
+        point = (100 + step, 100 + step)
+        kd.insert(point)
+        kd.delete(point)
+    kd.bulk_update(add = [(-1, -1)] * 60, remove = P[:50])
+    if kd.n <= 2 * kd.root.size + 1 and len(kd.coords) <= 4 * kd.root.size and sorted(kd.query((-1, -1), (9, 9))) == [(-1, -1)] * 60 + P[50:]:
+        print("Test kompaktowania: zaliczony!")
+    else:
+        print("Test kompaktowania: niezaliczony!!!")
+
+    # FlatKDtree z KDtree po usunieciu punktow - usuniete wiersze zostaja w points, ale nie w drzewie
+    kd = KDtree(P, 2, 1e-12, leaf_size = 2)
+    for point in P[:95]: kd.delete(point)
+    expected_distances, expected_indices = kd.knn_many([(9, 9)], 10)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'kd.idx')
+        kd.save(path)
+        found = [flat.knn_many([(9, 9)], 10) for flat in (FlatKDtree.from_kdtree(kd), FlatKDtree.load(path, mmap = False))]
+    if all(distances.shape == (1, 5) and sorted(indices[0].tolist()) == sorted(expected_indices[0].tolist()) and np.allclose(distances, expected_distances) for distances, indices in found):
+        print("Test knn_many po from_kdtree: zaliczony!")
+    else:
+        print("Test knn_many po from_kdtree: niezaliczony!!!")
+
 if __name__ == '__main__':
     runtests()
\ No newline at end of file
@@ -0,0 +1,199 @@
+import itertools
+import os
+import queue
+import sys
+import threading
+import numpy as np
+from kdtree.kdtree import KDtree
+from quadtree.quad import Quad
+
+# Wczytywanie dużych zbiorów punktów z plików porcjami, bez tworzenia listy krotek. Funkcje read_* zwracają
+# iteratory tablic (m, k) typu float64 (jak generators.stream_points), a build_* budują z nich drzewa.
+# Parametr progress - funkcja wywoływana po każdej porcji z liczbą przetworzonych i wszystkich bajtów pliku
+# (np. print_progress). Plik binarny można też zmapować w całości (map_binary_points) i przekazać do
+# KDtree bez kopiowania - współrzędne zostają wtedy w pliku (strony wczytywane są na żądanie).
+
+def print_progress(done, total):
+    """
+    Funkcja wypisuje postęp wczytywania pliku w jednej linii
+    :param done: liczba przetworzonych bajtów
+    :param total: rozmiar pliku w bajtach
+    """
+    print(f'\r{done / 2 ** 20:10.1f} / {total / 2 ** 20:.1f} MB ({done / max(total, 1):6.1%})', end = '' if done < total else '\n', file = sys.stderr, flush = True)
+
+def read_csv_points(path, k = 2, chunk_size = 10 ** 6, delimiter = ',', skiprows = 0, usecols = None, progress = None):
+    """
+    Funkcja wczytuje punkty z pliku CSV porcjami - każda porcja wierszy parsowana jest jednym wywołaniem np.loadtxt
+    :param path: ścieżka pliku
+    :param k: liczba wymiarów
+    :param chunk_size: maksymalna liczba punktów (wierszy pliku) w jednej porcji
+    :param delimiter: separator kolumn
+    :param skiprows: liczba pomijanych wierszy na początku pliku (np. 1 dla nagłówka)
+    :param usecols: numery k kolumn ze współrzędnymi (domyślnie k pierwszych kolumn)
+    :param progress: funkcja wywoływana po każdej porcji z liczbą wczytanych i wszystkich bajtów pliku
+    :return: iterator tablic (m, k) typu float64
+    """
+    usecols = tuple(range(k)) if usecols is None else tuple(usecols)
+    if len(usecols) != k: raise TypeError('Points does not match declared dimension!')
+    total = os.path.getsize(path)
+    #plik czytany jest binarnie - pozycja w pliku (postęp) jest wtedy dostępna także w trakcie iteracji po wierszach
+    with open(path, 'rb') as file:
+        for _ in range(skiprows): file.readline()
+        while True:
+            lines = list(itertools.islice(file, chunk_size))
+            if not lines: break
+            #porcja z samych pustych wierszy nie zawiera punktów
+            if any(line.strip() for line in lines):
+                yield np.loadtxt(lines, delimiter = delimiter, usecols = usecols, ndmin = 2, dtype = np.float64)
+            if progress is not None: progress(file.tell(), total)
+
+def map_binary_points(path, k = 2, dtype = np.float64, offset = 0):
+    """
+    Funkcja mapuje plik binarny z kolejnymi współrzędnymi punktów (x1, y1, x2, y2, ...) jako tablicę tylko do odczytu
+    :param path: ścieżka pliku
+    :param k: liczba wymiarów
+    :param dtype: typ współrzędnych w pliku (np. np.float32 lub '<f8')
+    :param offset: liczba bajtów nagłówka pomijanych na początku pliku
+    :return: tablica (n, k) typu np.memmap - dane nie są wczytywane do pamięci
+    """
+    points = np.memmap(path, dtype = dtype, mode = 'r', offset = offset)
+    if len(points) % k: raise TypeError('Points does not match declared dimension!')
+    return points.reshape(-1, k)
+
+class PointChunks:
+    """
+    Porcje punktów o znanej z góry łącznej liczbie (count), np. z pliku binarnego - collect_points
+    przydziela wtedy tablicę wyniku raz, bez powiększania
+    """
+    def __init__(self, chunks, count):
+        self.chunks = chunks
+        self.count = count
+    def __iter__(self): return iter(self.chunks)
+
+def read_binary_points(path, k = 2, dtype = np.float64, offset = 0, chunk_size = 10 ** 6, progress = None):
+    """
+    Funkcja wczytuje punkty z pliku binarnego porcjami, przez mapowanie pliku (map_binary_points)
+    :param path: ścieżka pliku
+    :param k: liczba wymiarów
+    :param dtype: typ współrzędnych w pliku
+    :param offset: liczba bajtów nagłówka pomijanych na początku pliku
+    :param chunk_size: maksymalna liczba punktów w jednej porcji
+    :param progress: funkcja wywoływana po każdej porcji z liczbą wczytanych i wszystkich bajtów pliku
+    :return: iterator tablic (m, k) typu float64 (PointChunks z liczbą punktów pliku)
+    """
+    points = map_binary_points(path, k, dtype, offset)
+    total, row = os.path.getsize(path), k * np.dtype(dtype).itemsize
+
+    def chunks():
+        for start in range(0, len(points), chunk_size):
+            #kopia porcji - w pamięci zostają tylko strony pliku z bieżącej porcji
+            chunk = np.array(points[start:start + chunk_size], dtype = np.float64)
+            if progress is not None: progress(offset + (start + len(chunk)) * row, total)
+            yield chunk
+
+    return PointChunks(chunks(), len(points))
+
+def write_binary_points(path, chunks, dtype = np.float64):
+    """
+    Funkcja zapisuje porcje punktów do pliku binarnego (np. konwersja pliku CSV do postaci mapowanej przez map_binary_points)
+    :param path: ścieżka pliku
+    :param chunks: iterator tablic (m, k)
+    :param dtype: typ zapisywanych współrzędnych
+    :return: liczba zapisanych punktów
+    """
+    n = 0
+    with open(path, 'wb') as file:
+        for chunk in chunks:
+            np.ascontiguousarray(chunk, dtype = dtype).tofile(file)
+            n += len(chunk)
+    return n
+
+def prefetch(chunks, depth = 2):
+    """
+    Funkcja czyta porcje w osobnym wątku, wyprzedzając ich przetwarzanie o co najwyżej depth porcji;
+    odczyt pliku zwalnia GIL, więc wczytywanie następnej porcji nakłada się z przetwarzaniem bieżącej
+    (w build_* - z kopiowaniem porcji do tablicy wyniku; sama budowa drzewa zaczyna się po wczytaniu wszystkich porcji)
+    :param chunks: iterator porcji
+    :param depth: maksymalna liczba porcji czekających na przetworzenie
+    :return: iterator tych samych porcji
+    """
+    buffer, stop = queue.Queue(depth), threading.Event()
+
+    def put(item):
+        #czekanie z limitem czasu - wątek kończy się, gdy odbiorca przestał pobierać porcje
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)): return
+            put((None, None))
+        except Exception as error:
+            put((None, error))
+
+    thread = threading.Thread(target = read, daemon = True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = buffer.get()
+            if error is not None: raise error
+            if chunk is None: return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+def collect_points(chunks, k = 2, count = None):
+    """
+    Funkcja łączy porcje punktów w jedną tablicę. Dla znanej liczby punktów (count albo PointChunks.count)
+    tablica przydzielana jest raz - szczytowe zużycie pamięci to wynik i jedna porcja. W przeciwnym razie
+    pojemność rośnie 1,5 raza: przy powiększaniu w pamięci są stara i nowa tablica i porcja, czyli do ok. 2,5
+    rozmiaru dotychczasowych punktów; na końcu nadmiarowa pojemność jest zwalniana (resize w miejscu)
+    :param chunks: iterator tablic (m, k)
+    :param k: liczba wymiarów
+    :param count: liczba punktów, jeśli jest znana (np. len(map_binary_points(...)))
+    :return: tablica (n, k) typu float64
+    """
+    if count is None: count = getattr(chunks, 'count', None)
+    points, n = np.empty((count or 1024, k)), 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype = float).reshape(-1, k)
+        if n + len(chunk) > len(points):
+            grown = np.empty((max(n + len(chunk), len(points) * 3 // 2), k))
+            grown[:n] = points[:n]
+            points = grown
+        points[n:n + len(chunk)] = chunk
+        n += len(chunk)
+    if n < len(points): points.resize((n, k), refcheck = False)
+    return points
+
+def build_kdtree(chunks, k = 2, count = None, **kwargs):
+    """
+    Funkcja buduje KDtree z porcji punktów - porcje zbierane są w jedną tablicę (collect_points),
+    z której drzewo budowane jest bez kopiowania
+    :param chunks: iterator tablic (m, k), np. z read_csv_points, read_binary_points lub generators.stream_points
+    :param k: liczba wymiarów
+    :param count: liczba punktów, jeśli jest znana (dla read_binary_points wyznaczana z rozmiaru pliku)
+    :param kwargs: pozostałe argumenty KDtree (eps, leaf_size, split_rule)
+    :return: obiekt KDtree
+    """
+    if count is None: count = getattr(chunks, 'count', None)
+    return KDtree(collect_points(prefetch(chunks), k, count), k, **kwargs)
+
+def build_quad(chunks, count = None, **kwargs):
+    """
+    Funkcja buduje Quad z porcji punktów - porcje zbierane są w jedną tablicę (collect_points),
+    z której drzewo budowane jest bez kopiowania
+    :param chunks: iterator tablic (m, 2)
+    :param count: liczba punktów, jeśli jest znana (dla read_binary_points wyznaczana z rozmiaru pliku)
+    :param kwargs: pozostałe argumenty Quad (bucket_size, max_depth, compressed)
+    :return: obiekt Quad
+    """
+    if count is None: count = getattr(chunks, 'count', None)
+    return Quad(collect_points(prefetch(chunks), 2, count), **kwargs)
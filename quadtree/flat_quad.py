@@ -0,0 +1,74 @@
+import numpy as np
+from common.batched import search_many
+from common.index_io import read_index, write_index
+
+MAGIC = b'QUADTR01' #identyfikator formatu pliku
+
+#FlatQuad - drzewo ćwiartek zapisane w tablicach (postać z Quad.flatten); służy do zapisu na dysk
+# i odczytu przez np.memmap - zapytania działają bezpośrednio na zmapowanych tablicach.
+# Węzeł v ma dzieci children[v] (kolejność NE, NW, SW, SE, -1 gdy brak), kwadrat [lower[v], upper[v]]
+# i obejmuje punkty order[start[v]:end[v]] (wiersze coords)
+class FlatQuad:
+    arrays = ('children', 'lower', 'upper', 'start', 'end', 'order', 'coords')
+    def __init__(self, children, lower, upper, start, end, order, coords, bucket_size, max_depth):
+        self.children, self.lower, self.upper = children, lower, upper
+        self.start, self.end, self.order, self.coords = start, end, order, coords
+        self.bucket_size = bucket_size
+        self.max_depth = max_depth
+    @classmethod
+    def from_quad(cls, quad):
+        return cls(*quad.flatten(), quad.bucket_size, quad.max_depth)
+    @property
+    def points(self): return self.coords
+    def save(self, path):
+        meta = {'bucket_size': self.bucket_size, 'max_depth': self.max_depth}
+        write_index(path, MAGIC, meta, {name: getattr(self, name) for name in FlatQuad.arrays})
+    #load wczytuje drzewo zapisane przez save; przy mmap = True tablice są mapowane tylko do odczytu
+    @classmethod
+    def load(cls, path, mmap = True):
+        meta, arrays = read_index(path, MAGIC, mmap)
+        return cls(*(arrays[name] for name in FlatQuad.arrays), meta['bucket_size'], meta['max_depth'])
+    #search przechodzi drzewo z jawnym stosem z tymi samymi regułami co Quad.query_range
+    # (węzły odrzucane jak w Rectangle.intersects); węzły zawarte w prostokącie zgłaszane są w całości;
+    # zwraca listę tablic indeksów, a przy count_only - liczbę punktów (przerywając po limit punktach)
+    def search(self, min_point, max_point, count_only = False, limit = float('inf')):
+        min_x, min_y = float(min_point[0]), float(min_point[1])
+        max_x, max_y = float(max_point[0]), float(max_point[1])
+        found, count = [], 0
+        stack = [0]
+        while stack and count < limit:
+            v = stack.pop()
+            start, end = int(self.start[v]), int(self.end[v])
+            if start == end: continue
+            lo_x, lo_y = self.lower[v].tolist()
+            hi_x, hi_y = self.upper[v].tolist()
+            if not (min_x <= hi_x and max_x >= lo_x and min_y <= hi_y and max_y >= lo_y): continue
+            if min_x <= lo_x and hi_x <= max_x and min_y <= lo_y and hi_y <= max_y:
+                if count_only: count += end - start
+                else: found.append(self.order[start:end])
+                continue
+            children = self.children[v].tolist()
+            if all(child < 0 for child in children):
+                indices = self.order[start:end]
+                c = self.coords[indices]
+                mask = (min_x <= c[:, 0]) & (c[:, 0] <= max_x) & (min_y <= c[:, 1]) & (c[:, 1] <= max_y)
+                if count_only: count += int(np.count_nonzero(mask))
+                else: found.append(indices[mask])
+                continue
+            stack.extend(child for child in children if child >= 0)
+        return count if count_only else found
+    def query_range_indices(self, min_point, max_point):
+        found = self.search(min_point, max_point)
+        return np.concatenate(found) if found else np.empty(0, dtype = np.int64)
+    def query_range(self, min_point, max_point):
+        return set(map(tuple, self.coords[self.query_range_indices(min_point, max_point)].tolist()))
+    def count(self, min_point, max_point):
+        return self.search(min_point, max_point, count_only = True)
+    def any_in(self, min_point, max_point):
+        return self.search(min_point, max_point, count_only = True, limit = 1) > 0
+    def query_many(self, lowers, uppers):
+        lowers, uppers = np.asarray(lowers, dtype = float), np.asarray(uppers, dtype = float)
+        if lowers.ndim != 2 or lowers.shape != uppers.shape or lowers.shape[1] != 2:
+            raise TypeError('Points does not match declared dimension!')
+        return search_many(self.children, self.lower, self.upper, self.start, self.end, self.order, self.coords,
+                           lowers, uppers, strict = True)
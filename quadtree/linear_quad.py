@@ -0,0 +1,167 @@
+import numpy as np
+from common.batched import expand_ranges, to_csr
+from quadtree.quad import BUCKET_SIZE, MAX_DEPTH
+
+MAX_BITS = 31 #liczba bitów współrzędnej komórki - klucz Mortona (2 * MAX_BITS bitów) mieści się w int64
+
+#interleave przeplata bity współrzędnych komórek (tablice int64 o co najwyżej MAX_BITS bitach):
+# bit i współrzędnej x trafia na pozycję 2i klucza, a bit i współrzędnej y na pozycję 2i + 1
+def interleave(qx, qy):
+    key = np.zeros(len(qx), dtype = np.uint64)
+    for shift, q in ((0, qx), (1, qy)):
+        q = q.astype(np.uint64)
+        q = (q | (q << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+        q = (q | (q << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+        q = (q | (q << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        q = (q | (q << np.uint64(2))) & np.uint64(0x3333333333333333)
+        q = (q | (q << np.uint64(1))) & np.uint64(0x5555555555555555)
+        key |= q << np.uint64(shift)
+    return key.astype(np.int64)
+
+#LinearQuad - liniowe drzewo ćwiartek: prostokąt ograniczający punkty dzielony jest na siatkę 2^bits x 2^bits
+# komórek, punkty sortowane są (jednym sortowaniem) według kluczy Mortona swoich komórek, a każda komórka
+# drzewa ćwiartek na poziomie l odpowiada spójnemu przedziałowi kluczy [prefiks << 2(bits - l), (prefiks + 1) << 2(bits - l)),
+# więc zakres jej punktów wyznaczają dwa wyszukiwania binarne. Liście (komórki o co najwyżej bucket_size punktach
+# albo na poziomie bits) zapisane są jako posortowane tablice kluczy, poziomów i początków zakresów punktów.
+# Zapytania porównują skwantowane granice prostokąta z komórkami - ponieważ kwantyzacja jest monotoniczna,
+# komórki ściśle wewnątrz prostokąta są zgłaszane w całości, a punkty komórek brzegowych sprawdzane dokładnie
+class LinearQuad:
+    def __init__(self, points, bucket_size = BUCKET_SIZE, max_depth = MAX_DEPTH):
+        if bucket_size < 1: raise ValueError('Bucket size must be positive!')
+        self.coords = np.array(points, dtype = float).reshape(-1, 2)
+        if len(self.coords) == 0: raise ValueError('LinearQuad cannot be empty!')
+        self.bucket_size = bucket_size
+        self.bits = min(max_depth, MAX_BITS)
+        self.lower = self.coords.min(axis = 0)
+        self.upper = self.coords.max(axis = 0)
+        width = self.upper - self.lower
+        self.scale = np.divide(float(1 << self.bits), width, out = np.zeros(2), where = width > 0)
+
+        cells = self.quantize(self.coords)
+        keys = interleave(cells[:, 0], cells[:, 1])
+        self.order = np.argsort(keys, kind = 'stable')
+        self.keys = keys[self.order]
+        self.build_leaves()
+    #points zwraca współrzędne punktów (indeksy w wynikach zapytań to numery wierszy)
+    @property
+    def points(self): return self.coords
+    @property
+    def n(self): return len(self.coords)
+    #quantize zwraca numery kolumn i wierszy siatki dla tablicy (m, 2) współrzędnych (funkcja niemalejąca)
+    def quantize(self, coords):
+        cells = np.floor((coords - self.lower) * self.scale)
+        return np.clip(cells, 0, (1 << self.bits) - 1).astype(np.int64)
+    #build_leaves wyznacza liście poziomami: komórki o co najwyżej bucket_size punktach stają się liśćmi,
+    # a punkty pozostałych są dzielone na następnym poziomie; zakresy punktów to serie równych prefiksów kluczy
+    def build_leaves(self):
+        leaf_keys, leaf_levels, leaf_starts = [], [], []
+        starts, ends = np.array([0]), np.array([self.n])
+        for level in range(self.bits + 1):
+            _, positions = expand_ranges(starts, ends)
+            shift = 2 * (self.bits - level)
+            prefix = self.keys[positions] >> shift
+            #początki serii: początki zakresów rodziców oraz zmiany prefiksu
+            first = np.ones(len(positions), dtype = bool)
+            first[1:] = prefix[1:] != prefix[:-1]
+            run_starts = positions[first]
+            run_ends = np.append(run_starts[1:], 0)
+            #koniec ostatniej serii każdego rodzica to koniec zakresu rodzica
+            last = np.searchsorted(run_starts, ends, side = 'left') - 1
+            run_ends[last] = ends
+            leaf = (run_ends - run_starts <= self.bucket_size) | (level == self.bits)
+            leaf_keys.append(prefix[first][leaf] << shift)
+            leaf_levels.append(np.full(np.count_nonzero(leaf), level, dtype = np.int8))
+            leaf_starts.append(run_starts[leaf])
+            starts, ends = run_starts[~leaf], run_ends[~leaf]
+            if len(starts) == 0: break
+        leaf_keys, leaf_starts = np.concatenate(leaf_keys), np.concatenate(leaf_starts)
+        order = np.argsort(leaf_starts, kind = 'stable')
+        self.leaf_keys, self.leaf_starts = leaf_keys[order], leaf_starts[order]
+        self.leaf_levels = np.concatenate(leaf_levels)[order]
+    @property
+    def leaves(self): return len(self.leaf_keys)
+    #query_bounds kwantyzuje prostokąty zapytań; granice poza prostokątem ograniczającym punkty zamieniane są
+    # na -1 i 2^bits, żeby komórki skrajne mogły być zgłoszone w całości
+    def query_bounds(self, lowers, uppers):
+        low, high = self.quantize(lowers), self.quantize(uppers)
+        low[lowers <= self.lower] = -1
+        high[uppers >= self.upper] = 1 << self.bits
+        return low, high
+    #search schodzi po komórkach poziomami, jednocześnie dla wszystkich zapytań (pary zapytanie - komórka);
+    # zwraca pary (numer zapytania, indeks punktu), a przy count_only - liczby punktów dla zapytań
+    def search(self, lowers, uppers, count_only = False):
+        lowers, uppers = np.asarray(lowers, dtype = float), np.asarray(uppers, dtype = float)
+        if lowers.ndim != 2 or lowers.shape != uppers.shape or lowers.shape[1] != 2:
+            raise TypeError('Points does not match declared dimension!')
+        m = len(lowers)
+        low, high = self.query_bounds(lowers, uppers)
+        #puste prostokąty i prostokąty rozłączne z punktami są pomijane od razu
+        valid = np.all((lowers <= uppers) & (lowers <= self.upper) & (uppers >= self.lower), axis = 1)
+        q = np.flatnonzero(valid)
+        zeros = np.zeros(len(q), dtype = np.int64)
+        cx, cy, prefix = zeros, zeros, zeros
+        start, end = zeros, np.full(len(q), self.n, dtype = np.int64)
+        counts = np.zeros(m, dtype = np.int64)
+        found_q, found_i = [], []
+
+        for level in range(self.bits + 1):
+            if len(q) == 0: break
+            shift = self.bits - level
+            lo_x, hi_x = cx << shift, ((cx + 1) << shift) - 1
+            lo_y, hi_y = cy << shift, ((cy + 1) << shift) - 1
+            outside = (hi_x < low[q, 0]) | (lo_x > high[q, 0]) | (hi_y < low[q, 1]) | (lo_y > high[q, 1])
+            inside = (lo_x > low[q, 0]) & (hi_x < high[q, 0]) & (lo_y > low[q, 1]) & (hi_y < high[q, 1])
+            partial = ~outside & ~inside
+            leaf = partial & ((end - start <= self.bucket_size) | (level == self.bits))
+
+            #komórki wewnątrz prostokąta - cały zakres punktów
+            if count_only:
+                counts += np.bincount(q[inside], weights = end[inside] - start[inside], minlength = m).astype(np.int64)
+            else:
+                owner, positions = expand_ranges(start[inside], end[inside])
+                found_q.append(q[inside][owner])
+                found_i.append(self.order[positions])
+            #liście brzegowe - punkty sprawdzane dokładnie
+            owner, positions = expand_ranges(start[leaf], end[leaf])
+            leaf_q, indices = q[leaf][owner], self.order[positions]
+            c = self.coords[indices]
+            hit = ((lowers[leaf_q, 0] <= c[:, 0]) & (c[:, 0] <= uppers[leaf_q, 0])
+                   & (lowers[leaf_q, 1] <= c[:, 1]) & (c[:, 1] <= uppers[leaf_q, 1]))
+            if count_only:
+                counts += np.bincount(leaf_q[hit], minlength = m)
+            else:
+                found_q.append(leaf_q[hit])
+                found_i.append(indices[hit])
+
+            #pozostałe komórki dzielone są na ćwiartki; granice zakresów dzieci z wyszukiwania binarnego
+            split = partial & ~leaf
+            q, cx, cy, prefix = q[split], cx[split], cy[split], prefix[split]
+            start, end = start[split], end[split]
+            if len(q) == 0: break
+            child_shift = 2 * (shift - 1)
+            bounds = [start] + [np.searchsorted(self.keys, (4 * prefix + c) << child_shift) for c in (1, 2, 3)] + [end]
+            q = np.repeat(q, 4)
+            cx = (2 * cx[:, None] + np.array([0, 1, 0, 1])).ravel()
+            cy = (2 * cy[:, None] + np.array([0, 0, 1, 1])).ravel()
+            prefix = (4 * prefix[:, None] + np.arange(4)).ravel()
+            start, end = np.stack(bounds[:4], axis = 1).ravel(), np.stack(bounds[1:], axis = 1).ravel()
+            nonempty = start < end
+            q, cx, cy, prefix, start, end = q[nonempty], cx[nonempty], cy[nonempty], prefix[nonempty], start[nonempty], end[nonempty]
+
+        if count_only: return counts
+        if not found_q: return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64)
+        return np.concatenate(found_q), np.concatenate(found_i)
+    #poniższe funkcje mają te same nazwy i wyniki co w Quad
+    def query_range_indices(self, min_point, max_point):
+        _, indices = self.search([min_point], [max_point])
+        return indices
+    def query_range(self, min_point, max_point):
+        return set(map(tuple, self.coords[self.query_range_indices(min_point, max_point)].tolist()))
+    def count(self, min_point, max_point):
+        return int(self.search([min_point], [max_point], count_only = True)[0])
+    def any_in(self, min_point, max_point):
+        return self.count(min_point, max_point) > 0
+    #query_many - wynik w formacie CSR (offsets, indices), jak w Quad.query_many
+    def query_many(self, lowers, uppers):
+        queries, indices = self.search(lowers, uppers)
+        return to_csr(len(np.asarray(lowers)), queries, indices)
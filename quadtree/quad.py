@@ -1,6 +1,15 @@
 from enum import Enum
+import numpy as np
+from common.arrays import as_point_array
+from common.batched import expand_ranges, search_many
+from quadtree.flat_quad import FlatQuad
 
-BUCKET_SIZE = 1 #ilość punktów przechowywanych w jednym liściu drzewa, domyślnie 1
+BUCKET_SIZE = 16 #ilość punktów przechowywanych w jednym liściu drzewa (liście z blokiem indeksów są szybsze od liści z jednym punktem)
+SMALL_LEAF = 16 #liście o co najwyżej tylu punktach przeszukiwane są bez operacji na tablicach
+#wspólna (tylko do odczytu) tablica indeksów pustych liści - pusta ćwiartka nie potrzebuje własnej tablicy
+NO_INDICES = np.empty(0, dtype = np.int64)
+NO_INDICES.flags.writeable = False
+MAX_DEPTH = 64 #maksymalna głębokość drzewa - głębiej liście nie są dzielone (np. dla powtórzonych punktów)
 def set_partition(points, x, y):
     p_ne = set()
     p_nw = set()
@@ -26,7 +35,13 @@ class Quarter(Enum):
     SW = 3
     SE = 4
 
+#ćwiartki według numeru 0 - SW, 1 - SE, 2 - NW, 3 - NE: pole węzła, Quarter i pozycja w wyniku rectangle_partition
+SLOTS = ('sw', 'se', 'nw', 'ne')
+QUARTERS = (Quarter.SW, Quarter.SE, Quarter.NW, Quarter.NE)
+PARTITION = (2, 3, 1, 0)
+
 class Rectangle:
+    __slots__ = ('min_x', 'min_y', 'max_x', 'max_y')
     def __init__(self, min_x, min_y, max_x, max_y):
         self.min_x = min_x
         self.min_y = min_y
@@ -45,16 +60,25 @@ class Rectangle:
         s_se = Rectangle(med_x, self.min_y, self.max_x, med_y)
 
         return s_ne, s_nw, s_sw, s_se
-    #intersects sprawdza, czy dwa prostokąty się przecinają
+    #intersects sprawdza, czy dwa (domknięte) prostokąty się przecinają - także na samym brzegu,
+    # żeby prostokąt zapytania o zerowym boku znajdował punkty leżące na brzegu kwadratu węzła
     def intersects(self, other):
-        return (self.min_x < other.max_x and self.max_x > other.min_x
-                and self.min_y < other.max_y and self.max_y > other.min_y)
+        return (self.min_x <= other.max_x and self.max_x >= other.min_x
+                and self.min_y <= other.max_y and self.max_y >= other.min_y)
     #contains sprawdza, czy punkt należy do prostokąta
     def contains(self, point):
         x, y = point
         if self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y:
             return True
         return False
+    #contains_mask sprawdza dla tablicy (m, 2) punktów, które z nich należą do prostokąta
+    def contains_mask(self, coords):
+        return ((self.min_x <= coords[:, 0]) & (coords[:, 0] <= self.max_x)
+                & (self.min_y <= coords[:, 1]) & (coords[:, 1] <= self.max_y))
+    #contains_rectangle sprawdza, czy drugi prostokąt w całości zawiera się w tym prostokącie
+    def contains_rectangle(self, other):
+        return (self.min_x <= other.min_x and other.max_x <= self.max_x
+                and self.min_y <= other.min_y and other.max_y <= self.max_y)
     #draw rysuje prostokąt w wizualizerze
     def draw(self, visualizer, color):
         return visualizer.add_line_segment((((self.min_x, self.min_y), (self.max_x, self.min_y)),
@@ -62,86 +86,335 @@ class Rectangle:
                                      ((self.min_x, self.max_y), (self.max_x, self.max_y)),
                                      ((self.max_x, self.min_y), (self.max_x, self.max_y))), color = color)
 
-class Node:
+#Node jest swoim kwadratem - granice przechowywane są jako pola węzła (bez osobnego obiektu Rectangle),
+# a __slots__ usuwa słownik atrybutów z każdej instancji
+class Node(Rectangle):
+    __slots__ = ('tree', 'quarter', 'parent', 'ne', 'nw', 'sw', 'se', 'indices', 'size')
     def __init__(self, tree, quarter, square, parent = None, children = (None, None, None, None)):
+        Rectangle.__init__(self, square.min_x, square.min_y, square.max_x, square.max_y)
         self.tree = tree
         self.quarter = quarter
         self.parent = parent
-        self.square = square
         self.ne, self.nw, self.sw, self.se = children
-        self.points = None
-    def __str__(self): return f'{self.square} {self.points}'
-    def is_leaf(self): return self.points is not None and self != self.tree.root
-    #construct_subtree rekurencyjnie tworzy drzewo ćwiartek w dół od danego liścia,
-    # aż w każdym liściu będzie co najwyżej BUCKET_SIZE punków
-    def construct_subtree(self, points, forced = False):
-        if len(points) <= BUCKET_SIZE and not forced:
-            self.points = points
-            self.tree.leaves.append(self)
-        else:
-            x = self.square.med_x()
-            y = self.square.med_y()
-            p_ne, p_nw, p_sw, p_se = set_partition(points, x, y)
-            s_ne, s_nw, s_sw, s_se = self.square.rectangle_partition()
-
-            self.ne = Node(self.tree, Quarter.NE, s_ne, self)
-            self.nw = Node(self.tree, Quarter.NW, s_nw, self)
-            self.sw = Node(self.tree, Quarter.SW, s_sw, self)
-            self.se = Node(self.tree, Quarter.SE, s_se, self)
-
-            self.ne.construct_subtree(p_ne)
-            self.nw.construct_subtree(p_nw)
-            self.sw.construct_subtree(p_sw)
-            self.se.construct_subtree(p_se)
-    #rekurencyjne wstawianie punktu do gotowego drzewa
-    def insert_subtree(self, point):
-        if not self.square.contains(point): return False
-        if self.is_leaf():
-            if len(self.points) < BUCKET_SIZE:
-                self.points.add(point)
-                return True
+        #w liściu: tablica indeksów punktów (wierszy tree.coords), w węźle wewnętrznym None
+        self.indices = None
+        #liczba punktów w poddrzewie
+        self.size = 0
+    def __str__(self): return f'{Rectangle.__str__(self)} {self.points()}'
+    def is_leaf(self): return self.indices is not None and self != self.tree.root
+    #points zwraca współrzędne punktów liścia jako tablicę (m, 2)
+    def points(self): return None if self.indices is None else self.tree.coords.take(self.indices, axis = 0)
+    #points_in zwraca punkty liścia (krotki) należące do prostokąta; małe liście sprawdzane są
+    # punkt po punkcie, bo dla kilku punktów operacje na tablicach są droższe
+    def points_in(self, range_rect):
+        if len(self.indices) == 0: return []
+        coords = self.points()
+        if len(coords) <= SMALL_LEAF:
+            return [point for point in map(tuple, coords.tolist()) if range_rect.contains(point)]
+        return list(map(tuple, coords[range_rect.contains_mask(coords)].tolist()))
+    #construct_subtree tworzy drzewo ćwiartek w dół od danego liścia, aż w każdym liściu będzie
+    # co najwyżej tree.bucket_size punków (albo do głębokości tree.max_depth); drzewo budowane jest
+    # poziomami - punkty wszystkich dzielonych węzłów poziomu są rozdzielane na ćwiartki jedną operacją
+    # na tablicach, a liście dostają fragmenty (widoki) wspólnej tablicy perm
+    def construct_subtree(self, indices, forced = False, depth = 0):
+        tree = self.tree
+        self.size = len(indices)
+        if (len(indices) <= tree.bucket_size or depth >= tree.max_depth) and not forced:
+            self.indices = indices
+            tree.leaves.add(self)
+            return
+        if tree.compressed and not forced:
+            #powtórzony punkt nie może zostać rozdzielony - wszystkie kopie zostają w jednym liściu
+            coords = tree.coords[np.asarray(indices)]
+            if (coords == coords[0]).all():
+                self.indices = np.asarray(indices, dtype = np.int64)
+                tree.leaves.add(self)
+                return
+        tree.leaves.discard(self)
+        if len(indices) <= SMALL_LEAF:
+            #małe zbiory (np. dzielony liść przy insert) dzielone są bez operacji na tablicach
+            indices = np.asarray(indices).tolist()
+            self.split_small(list(zip(indices, tree.coords[indices].tolist())), depth)
+            return
+
+        perm = np.array(indices, dtype = np.int64)
+        nodes, starts, ends = [self], np.array([0]), np.array([len(perm)])
+        while nodes:
+            depth += 1
+            owner, positions = expand_ranges(starts, ends)
+            idx = perm[positions]
+            med_x = np.array([node.med_x() for node in nodes])
+            med_y = np.array([node.med_y() for node in nodes])
+            #numer ćwiartki: 0 - SW, 1 - SE, 2 - NW, 3 - NE (te same reguły co set_partition)
+            key = 4 * owner + (tree.coords[idx, 0] > med_x[owner]) + 2 * (tree.coords[idx, 1] > med_y[owner])
+            order = np.argsort(key, kind = 'stable')
+            perm[positions] = idx[order]
+            counts = np.bincount(key, minlength = 4 * len(nodes)).reshape(-1, 4)
+            child_starts = (starts[:, None] + np.cumsum(counts, axis = 1) - counts).tolist()
+            if tree.compressed:
+                #prostokąty ograniczające punkty niepustych ćwiartek
+                offsets = np.cumsum(counts.ravel()) - counts.ravel()
+                nonempty = np.flatnonzero(counts.ravel())
+                coords = tree.coords[idx[order]]
+                boxes = dict(zip(nonempty.tolist(), np.hstack((np.minimum.reduceat(coords, offsets[nonempty]),
+                                                               np.maximum.reduceat(coords, offsets[nonempty]))).tolist()))
+            counts = counts.tolist()
+
+            next_nodes, next_starts, next_ends = [], [], []
+            for i, node in enumerate(nodes):
+                #dzielony liść przestaje przechowywać punkty - trafiają one do dzieci
+                node.indices = None
+                squares = node.rectangle_partition()
+                for q in range(4):
+                    start, count = child_starts[i][q], counts[i][q]
+                    square, single = squares[PARTITION[q]], False
+                    if tree.compressed:
+                        #puste ćwiartki nie są tworzone, a kwadrat dziecka zawężany jest do najmniejszej
+                        # komórki zawierającej jego punkty (pomijając łańcuch węzłów o jednym dziecku)
+                        if count == 0:
+                            setattr(node, SLOTS[q], None)
+                            continue
+                        min_x, min_y, max_x, max_y = boxes[4 * i + q]
+                        single = min_x == max_x and min_y == max_y
+                        if not single: square = shrink_square(square, min_x, min_y, max_x, max_y)
+                    child = Node(tree, QUARTERS[q], square, node)
+                    setattr(node, SLOTS[q], child)
+                    child.size = count
+                    if count <= tree.bucket_size or depth >= tree.max_depth or single:
+                        child.indices = perm[start:start + count] if count else NO_INDICES
+                        tree.leaves.add(child)
+                    else:
+                        next_nodes.append(child)
+                        next_starts.append(start)
+                        next_ends.append(start + count)
+            nodes, starts, ends = next_nodes, np.array(next_starts, dtype = np.int64), np.array(next_ends, dtype = np.int64)
+    #split_small dzieli węzeł rekurencyjnie dla listy par (indeks, (x, y)), tymi samymi regułami co construct_subtree
+    def split_small(self, items, depth):
+        tree = self.tree
+        self.size = len(items)
+        single = tree.compressed and all(point == items[0][1] for _, point in items)
+        if len(items) <= tree.bucket_size or depth >= tree.max_depth or single:
+            self.indices = np.array([index for index, _ in items], dtype = np.int64) if items else NO_INDICES
+            tree.leaves.add(self)
+            return
+        self.indices = None
+        med_x, med_y = self.med_x(), self.med_y()
+        #numer ćwiartki: 0 - SW, 1 - SE, 2 - NW, 3 - NE
+        parts = ([], [], [], [])
+        for item in items:
+            x, y = item[1]
+            parts[(x > med_x) + 2 * (y > med_y)].append(item)
+        squares = self.rectangle_partition()
+        for q in range(4):
+            square = squares[PARTITION[q]]
+            if tree.compressed:
+                if not parts[q]:
+                    setattr(self, SLOTS[q], None)
+                    continue
+                xs, ys = [point[0] for _, point in parts[q]], [point[1] for _, point in parts[q]]
+                if len(parts[q]) > 1: square = shrink_square(square, min(xs), min(ys), max(xs), max(ys))
+            child = Node(tree, QUARTERS[q], square, self)
+            setattr(self, SLOTS[q], child)
+            child.split_small(parts[q], depth + 1)
+    #find_leaf schodzi iteracyjnie od węzła do liścia, do którego należy punkt (x, y); ćwiartka wybierana jest
+    # arytmetycznie ze środka kwadratu, z tymi samymi regułami co set_partition (x <= med_x - zachód,
+    # y <= med_y - południe); zwraca parę (liść, głębokość liścia)
+    def find_leaf(self, x, y, depth = 0):
+        node = self
+        while node.indices is None:
+            if x <= (node.max_x + node.min_x) / 2.0:
+                child = node.nw if y > (node.max_y + node.min_y) / 2.0 else node.sw
             else:
-                points_to_add = self.points.copy()
-                points_to_add.add(point)
-                self.construct_subtree(points_to_add)
-                return True
-        if self.ne.insert_subtree(point): return True
-        if self.nw.insert_subtree(point): return True
-        if self.se.insert_subtree(point): return True
-        if self.sw.insert_subtree(point): return True
-    #rekurencyjne wyszukiwanie punktów
-    def query_range_subtree(self, range_rect):
+                child = node.ne if y > (node.max_y + node.min_y) / 2.0 else node.se
+            if self.tree.compressed:
+                if child is None or not child.contains((x, y)):
+                    return node.add_child(x, y, child), depth + 1
+            elif not child.contains((x, y)):
+                #granice ćwiartek powiększonego korzenia mogą różnić się od środka o błąd zaokrąglenia
+                child = next(c for c in (node.ne, node.nw, node.sw, node.se) if c.contains((x, y)))
+            node = child
+            depth += 1
+        return node, depth
+    #add_child (tryb skompresowany) tworzy pusty liść dla punktu (x, y) w jego ćwiartce węzła; jeśli ćwiartkę
+    # zajmuje dziecko o mniejszym kwadracie, wstawiany jest nad nim węzeł o najmniejszej komórce obejmującej
+    # to dziecko i punkt; zwraca nowy liść
+    def add_child(self, x, y, child):
+        tree = self.tree
+        q = (x > self.med_x()) + 2 * (y > self.med_y())
+        square = self.rectangle_partition()[PARTITION[q]]
+        parent, slot = self, q
+        if child is not None:
+            center_x, center_y = child.med_x(), child.med_y()
+            while True:
+                med_x, med_y = square.med_x(), square.med_y()
+                q_child = (center_x > med_x) + 2 * (center_y > med_y)
+                q = (x > med_x) + 2 * (y > med_y)
+                inner = square.rectangle_partition()[PARTITION[q]]
+                if q != q_child or inner.contains_rectangle(square): break
+                square = inner
+            parent = Node(tree, QUARTERS[slot], square, self)
+            parent.size = child.size
+            setattr(self, SLOTS[slot], parent)
+            child.parent, child.quarter = parent, QUARTERS[q_child]
+            setattr(parent, SLOTS[q_child], child)
+            square = square.rectangle_partition()[PARTITION[q]]
+        leaf = Node(tree, QUARTERS[q], square, parent)
+        leaf.indices = NO_INDICES
+        setattr(parent, SLOTS[q], leaf)
+        tree.leaves.add(leaf)
+        return leaf
+    #add_point dodaje punkt o indeksie index do liścia na głębokości depth, dzieląc liść po przekroczeniu pojemności
+    def add_point(self, index, depth):
+        indices = np.append(self.indices, index)
+        if len(self.indices) < self.tree.bucket_size or depth >= self.tree.max_depth:
+            self.indices = indices
+            self.size = len(indices)
+        else:
+            self.construct_subtree(indices, depth = depth)
+    #iteracyjne wstawianie punktu o indeksie index do gotowego drzewa
+    def insert_subtree(self, index, depth = 0):
+        x, y = self.tree.coords[index].tolist()
+        if not self.contains((x, y)): return False
+        leaf, depth = self.find_leaf(x, y, depth)
+        node = leaf
+        while node is not self:
+            node = node.parent
+            node.size += 1
+        leaf.add_point(index, depth)
+        return True
+    #locate szuka liścia zawierającego punkt (opcjonalnie o danym indeksie w tree.coords); zwraca
+    # parę (liść, pozycja w jego indices) albo None - punkty na granicach ćwiartek mogą leżeć
+    # w kilku kwadratach, więc sprawdzane są wszystkie niepuste dzieci zawierające punkt
+    def locate(self, point, index = None):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node.size or not node.contains(point): continue
+            if node.indices is not None:
+                if index is not None:
+                    found = np.flatnonzero(node.indices == index)
+                else:
+                    coords = node.points()
+                    found = np.flatnonzero((coords[:, 0] == point[0]) & (coords[:, 1] == point[1]))
+                if len(found): return node, int(found[0])
+                continue
+            for child in (node.ne, node.nw, node.sw, node.se):
+                if child is not None: stack.append(child)
+        return None
+    #collapse zamienia poddrzewo w jeden liść ze wszystkimi jego punktami
+    def collapse(self):
+        tree = self.tree
+        indices, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            if node.indices is not None:
+                indices.append(node.indices)
+                tree.leaves.discard(node)
+            for child in (node.ne, node.nw, node.sw, node.se):
+                if child is not None: stack.append(child)
+        self.ne = self.nw = self.sw = self.se = None
+        self.indices = np.concatenate(indices).astype(np.int64)
+        tree.leaves.add(self)
+    #remove_at usuwa punkt z pozycji position liścia; rozmiary przodków są zmniejszane, a najwyższy
+    # przodek, w którego poddrzewie zostało co najwyżej tree.bucket_size punktów, staje się liściem
+    def remove_at(self, position):
+        self.indices = np.delete(self.indices, position)
+        self.size -= 1
+        merged, node = None, self.parent
+        while node is not None:
+            node.size -= 1
+            if node.size <= self.tree.bucket_size: merged = node
+            node = node.parent
+        if merged is not None: merged.collapse()
+        elif self.tree.compressed and self.size == 0: self.detach()
+    #detach (tryb skompresowany) odłącza pusty liść; węzeł, któremu zostało jedno dziecko, zastępowany jest tym dzieckiem
+    def detach(self):
+        tree, parent = self.tree, self.parent
+        if parent is None: return
+        tree.leaves.discard(self)
+        for name in SLOTS:
+            if getattr(parent, name) is self: setattr(parent, name, None)
+        children = [child for child in (parent.ne, parent.nw, parent.sw, parent.se) if child is not None]
+        if len(children) == 1 and parent.parent is not None:
+            child, grandparent = children[0], parent.parent
+            for name in SLOTS:
+                if getattr(grandparent, name) is parent: setattr(grandparent, name, child)
+            child.parent, child.quarter = grandparent, parent.quarter
+    #rekurencyjne wyszukiwanie punktów; record - rekord QueryStats, w którym zliczane są kroki
+    # przeszukiwania (tylko, gdy do drzewa dołączone są statystyki - tree.stats), domyślnie None
+    def query_range_subtree(self, range_rect, record = None):
         result = set()
-        if self.square.intersects(range_rect):
-            if self.points is not None:
-                for point in self.points:
-                    if range_rect.contains(point):
-                        result.add(point)
-            if self.ne is not None:
-                r_ne = self.ne.query_range_subtree(range_rect)
-                if r_ne is not None: result.update(r_ne)
-            if self.nw is not None:
-                r_nw = self.nw.query_range_subtree(range_rect)
-                if r_nw is not None: result.update(r_nw)
-            if self.sw is not None:
-                r_sw = self.sw.query_range_subtree(range_rect)
-                if r_sw is not None: result.update(r_sw)
-            if self.se is not None:
-                r_se = self.se.query_range_subtree(range_rect)
-                if r_se is not None: result.update(r_se)
+        if record is not None: record['visited'] += 1
+        #puste poddrzewa (np. puste ćwiartki) są pomijane bez sprawdzania kwadratu
+        if not self.size or not self.intersects(range_rect):
+            if record is not None: record['pruned'] += 1
+            return result
+        if self.indices is not None:
+            if record is not None: record['points_tested'] += len(self.indices)
+            result.update(self.points_in(range_rect))
+        for child in (self.ne, self.nw, self.sw, self.se):
+            if child is not None: result.update(child.query_range_subtree(range_rect, record))
         return result
+    #iteracyjne (jawny stos) wyszukiwanie punktów zwracające generator; punkty są oddawane
+    # na bieżąco, a liście poddrzew zawartych w całości w prostokącie są oddawane bez sprawdzania punktów
+    def iter_range_subtree(self, range_rect):
+        stack = [(self, False)]
+        while stack:
+            node, inside = stack.pop()
+            if not inside:
+                if not node.intersects(range_rect): continue
+                inside = range_rect.contains_rectangle(node)
+            if node.indices is not None:
+                if inside: yield from map(tuple, node.points().tolist())
+                else: yield from node.points_in(range_rect)
+            for child in (node.se, node.sw, node.nw, node.ne):
+                if child is not None: stack.append((child, inside))
+    #iteracyjne wyszukiwanie indeksów punktów (wierszy tree.coords) zwracające listę tablic; każdy wiersz
+    # oddawany jest osobno (także powtórzone punkty), a liście poddrzew zawartych w całości w prostokącie
+    # oddawane są bez sprawdzania punktów
+    def query_indices_subtree(self, range_rect):
+        coords, found = self.tree.coords, []
+        stack = [(self, False)]
+        while stack:
+            node, inside = stack.pop()
+            if not inside:
+                if not node.size or not node.intersects(range_rect): continue
+                inside = range_rect.contains_rectangle(node)
+            if node.indices is not None and len(node.indices):
+                found.append(node.indices if inside else node.indices[range_rect.contains_mask(coords[node.indices])])
+            for child in (node.se, node.sw, node.nw, node.ne):
+                if child is not None: stack.append((child, inside))
+        return found
+    #rekurencyjne zliczanie punktów bez ich zbierania; poddrzewa zawarte w całości w prostokącie
+    # zwracają zapamiętany rozmiar, a przeszukiwanie kończy się po znalezieniu limit punktów;
+    # record - jak w query_range_subtree
+    def count_subtree(self, range_rect, limit = float('inf'), record = None):
+        if record is not None: record['visited'] += 1
+        if not self.intersects(range_rect):
+            if record is not None: record['pruned'] += 1
+            return 0
+        if range_rect.contains_rectangle(self):
+            if record is not None: record['reported_subtrees'] += 1
+            return self.size
+        count = 0
+        if self.indices is not None:
+            if record is not None: record['points_tested'] += len(self.indices)
+            count += len(self.points_in(range_rect))
+        for child in (self.ne, self.nw, self.sw, self.se):
+            if child is not None and count < limit:
+                count += child.count_subtree(range_rect, limit - count, record)
+        return count
     #wersja wyszukiwania z wizualizacją
     def graphic_query_range_subtree(self, range_rect, visualizer, color):
         result = set()
-        temp_square = self.square.draw(visualizer, color)
+        temp_square = Rectangle.draw(self, visualizer, color)
         stay = False
-        if self.square.intersects(range_rect):
-            if self.points is not None:
+        if self.intersects(range_rect):
+            if self.indices is not None:
                 stay = True
-                for point in self.points:
-                    if range_rect.contains(point):
-                        visualizer.add_point(point, color = color)
-                        result.add(point)
+                for point in self.points_in(range_rect):
+                    visualizer.add_point(point, color = color)
+                    result.add(point)
             if self.ne is not None:
                 r_ne = self.ne.graphic_query_range_subtree(range_rect, visualizer, color)
                 if r_ne is not None: result.update(r_ne)
@@ -158,33 +431,287 @@ class Node:
            visualizer.remove_figure(temp_square)
         return result
     def draw(self, visualizer, color):
-        self.square.draw(visualizer, color)
+        Rectangle.draw(self, visualizer, color)
         if self.ne is not None: self.ne.draw(visualizer, color)
         if self.nw is not None: self.nw.draw(visualizer, color)
         if self.sw is not None: self.sw.draw(visualizer, color)
         if self.se is not None: self.se.draw(visualizer, color)
 class Quad:
-    def __init__(self, points):
-        self.points = points
-        self.leaves = []
-        self.root = Node(self, None, min_square(points))
-        self.root.construct_subtree(points)
+    def __init__(self, points, bucket_size = BUCKET_SIZE, max_depth = MAX_DEPTH, compressed = False):
+        if bucket_size < 1: raise ValueError('Bucket size must be positive!')
+        self.bucket_size = bucket_size
+        self.max_depth = max_depth
+        #tryb skompresowany: bez pustych ćwiartek i łańcuchów węzłów o jednym dziecku, powtórzone punkty
+        # w jednym liściu - liczba węzłów jest O(n) niezależnie od rozkładu punktów
+        self.compressed = compressed
+        #współrzędne punktów jako tablica (pojemność, 2); wiersze za self.n są wolnym miejscem dla insert;
+        # tablica (n, 2) (lub inny obiekt z protokołem bufora) używana jest bez kopiowania - drzewo odwołuje się
+        # do jej wierszy przez indeksy i kopiuje ją dopiero przed pierwszą zmianą (borrowed)
+        coords = as_point_array(points, 2)
+        self.borrowed = coords is not None
+        self.coords = np.array(points, dtype = float).reshape(-1, 2) if coords is None else coords
+        self.n = len(self.coords)
+        #zbiór aktualnych liści drzewa (dzielone i scalane liście są z niego usuwane)
+        self.leaves = set()
+        self.root = Node(self, None, min_square(self.coords))
+        self.root.construct_subtree(np.arange(self.n))
+        #tablice węzłów dla zapytań wsadowych, tworzone przy pierwszym query_many
+        self.flat = None
+        #liczba podwojeń obszaru korzenia przy wstawianiu punktów spoza niego
+        self.growths = 0
+        #statystyki zapytań (common.stats.QueryStats), None - zapytania bez śledzenia
+        self.stats = None
     def __str__(self): return self.leaves
+    #points zwraca współrzędne wszystkich punktów drzewa (indeksy używane w wynikach query_many)
+    @property
+    def points(self): return self.coords[:self.n]
+    #own_coords kopiuje współrzędne przed ich zmianą, jeśli są tablicą przekazaną do konstruktora
+    def own_coords(self):
+        if self.borrowed: self.coords, self.borrowed = self.coords.copy(), False
+    #grow_root podwaja obszar korzenia w stronę punktu, dopóki punkt nie znajdzie się w jego kwadracie;
+    # dotychczasowy korzeń staje się (bez przebudowy) jedną z ćwiartek nowego, pozostałe są pustymi liśćmi
+    def grow_root(self, point):
+        x, y = float(point[0]), float(point[1])
+        while not self.root.contains((x, y)):
+            old = self.root
+            square = old
+            width, height = square.max_x - square.min_x, square.max_y - square.min_y
+            #zdegenerowany obszar (np. jeden punkt) rośnie o odległość do nowego punktu
+            distance = max(abs(x - square.min_x), abs(y - square.min_y))
+            width, height = width or height or distance, height or width or distance
+            west, south = x < square.min_x, y < square.min_y
+            min_x, max_x = (square.min_x - width, square.max_x) if west else (square.min_x, square.max_x + width)
+            min_y, max_y = (square.min_y - height, square.max_y) if south else (square.min_y, square.max_y + height)
+
+            root = Node(self, None, Rectangle(min_x, min_y, max_x, max_y))
+            root.size = old.size
+            quarter = (Quarter.NE if south else Quarter.SE) if west else (Quarter.NW if south else Quarter.SW)
+            #granice ćwiartek wyznaczane są z granic starego korzenia, żeby przylegały do niego dokładnie
+            mid_x = square.min_x if west else square.max_x
+            mid_y = square.min_y if south else square.max_y
+            squares = (Rectangle(mid_x, mid_y, max_x, max_y), Rectangle(min_x, mid_y, mid_x, max_y),
+                       Rectangle(min_x, min_y, mid_x, mid_y), Rectangle(mid_x, min_y, max_x, mid_y))
+            children = []
+            for q, s in zip((Quarter.NE, Quarter.NW, Quarter.SW, Quarter.SE), squares):
+                if q == quarter:
+                    old.quarter, old.parent = q, root
+                    children.append(old)
+                    continue
+                if self.compressed:
+                    children.append(None)
+                    continue
+                child = Node(self, q, s, root)
+                child.indices = NO_INDICES
+                self.leaves.add(child)
+                children.append(child)
+            root.ne, root.nw, root.sw, root.se = children
+            self.root = root
+            self.growths += 1
     #poniższe funkcje wywołują swoje rekurencyjne odpowiedniki
-    def insert(self, point): return self.root.insert_subtree(point)
+    #insert wstawia punkt (punkty spoza kwadratu korzenia powiększają drzewo); zwraca True po wstawieniu
+    def insert(self, point):
+        if not np.isfinite(point).all(): raise ValueError('Point coordinates must be finite!')
+        self.grow_root(point)
+        if self.n == len(self.coords):
+            #podwajanie pojemności tablicy współrzędnych
+            self.coords = np.concatenate((self.coords, np.empty((max(self.n, 1), 2))))
+            self.borrowed = False
+        #po usunięciu ostatnich wierszy tablica przekazana do konstruktora ma wolne wiersze, ale nie może być zmieniana
+        self.own_coords()
+        self.coords[self.n] = point
+        self.n += 1
+        self.flat = None
+        return self.root.insert_subtree(self.n - 1)
+    #remove usuwa jedno wystąpienie punktu; wiersz ostatniego punktu w coords przechodzi na miejsce
+    # usuniętego (zmienia się jego indeks), więc coords nie rośnie przy wielokrotnym usuwaniu i wstawianiu
+    def remove(self, point):
+        found = self.root.locate(point)
+        if found is None: return False
+        leaf, position = found
+        index = int(leaf.indices[position])
+        leaf.remove_at(position)
+
+        last = self.n - 1
+        if index != last:
+            leaf, position = self.root.locate(self.coords[last], last)
+            #liście mogą być widokami wspólnej tablicy, więc indeksy są kopiowane przed zmianą
+            leaf.indices = leaf.indices.copy()
+            leaf.indices[position] = index
+            self.own_coords()
+            self.coords[index] = self.coords[last]
+        self.n -= 1
+        self.flat = None
+        return True
+    #move przenosi punkt old w miejsce new; jeśli new leży w kwadracie tego samego liścia,
+    # zmieniane są tylko współrzędne, w przeciwnym razie punkt jest usuwany i wstawiany ponownie
+    def move(self, old, new):
+        #new sprawdzany przed usunięciem old - błąd nie może zostawić drzewa bez przenoszonego punktu
+        if not np.isfinite(new).all(): raise ValueError('Point coordinates must be finite!')
+        found = self.root.locate(old)
+        if found is None: return False
+        leaf, position = found
+        self.flat = None
+        if leaf.contains(new):
+            self.own_coords()
+            self.coords[leaf.indices[position]] = new
+            return True
+        self.remove(old)
+        return self.insert(new)
+    #insert_many wstawia wiele punktów; punkty sortowane są według kodu Mortona, więc kolejne punkty trafiają
+    # do sąsiednich liści - zejście zaczyna się od najbliższego przodka poprzedniego liścia zawierającego punkt;
+    # zwraca liczbę wstawionych punktów
+    def insert_many(self, points):
+        points = np.asarray(points, dtype = float).reshape(-1, 2)
+        if len(points) == 0: return 0
+        if not np.isfinite(points).all(): raise ValueError('Point coordinates must be finite!')
+        self.grow_root(points.min(axis = 0))
+        self.grow_root(points.max(axis = 0))
+        m, start = len(points), self.n
+        if start + m > len(self.coords):
+            #podwajanie pojemności tablicy współrzędnych
+            self.coords = np.concatenate((self.coords, np.empty((max(start + m, 2 * len(self.coords)) - len(self.coords), 2))))
+            self.borrowed = False
+        self.own_coords()
+        self.coords[start:start + m] = points
+        self.n += m
+        self.flat = None
+
+        order = np.argsort(morton_codes(points, self.root), kind = 'stable')
+        node, depth = self.root, 0
+        for index, (x, y) in zip((order + start).tolist(), points[order].tolist()):
+            while not node.contains((x, y)):
+                node = node.parent
+                depth -= 1
+            leaf, depth = node.find_leaf(x, y, depth)
+            ancestor = leaf
+            while ancestor.parent is not None:
+                ancestor = ancestor.parent
+                ancestor.size += 1
+            leaf.add_point(index, depth)
+            node = leaf
+        return m
     def query_range(self, min_point, max_point):
-        range_rect = Rectangle(min_point[0], min_point[1], max_point[0], max_point[1])
+        range_rect = range_rectangle(min_point, max_point)
+        if self.stats is not None: return self.traced('query_range', range_rect)
         return self.root.query_range_subtree(range_rect)
+    #query_range_indices zwraca tablicę indeksów (wierszy self.points, dla tablicy przekazanej do konstruktora -
+    # jej wierszy, dopóki drzewo nie jest zmieniane) punktów w prostokącie, bez tworzenia krotek
+    def query_range_indices(self, min_point, max_point):
+        range_rect = range_rectangle(min_point, max_point)
+        found = self.root.query_indices_subtree(range_rect)
+        return np.concatenate(found).astype(np.int64, copy = False) if found else np.empty(0, dtype = np.int64)
+    def iter_range(self, min_point, max_point):
+        range_rect = range_rectangle(min_point, max_point)
+        return self.root.iter_range_subtree(range_rect)
+    def count(self, min_point, max_point):
+        range_rect = range_rectangle(min_point, max_point)
+        if self.stats is not None: return self.traced('count', range_rect)
+        return self.root.count_subtree(range_rect)
+    def any_in(self, min_point, max_point):
+        range_rect = range_rectangle(min_point, max_point)
+        if self.stats is not None: return self.traced('any_in', range_rect, 1) > 0
+        return self.root.count_subtree(range_rect, 1) > 0
+    #traced wykonuje zapytanie ze śledzeniem i zapisuje jego rekord w self.stats
+    def traced(self, kind, range_rect, limit = float('inf')):
+        record = self.stats.start(kind)
+        if kind == 'query_range':
+            result = self.root.query_range_subtree(range_rect, record)
+            self.stats.finish(record, len(result))
+        else:
+            result = self.root.count_subtree(range_rect, limit, record)
+            self.stats.finish(record, result)
+        return result
     def graphic_query_range(self, min_point, max_point, visualizer, color):
-        range_rect = Rectangle(min_point[0], min_point[1], max_point[0], max_point[1])
+        range_rect = range_rectangle(min_point, max_point)
         range_rect.draw(visualizer, 'brown')
         return self.root.graphic_query_range_subtree(range_rect, visualizer, color)
+    #flatten zapisuje drzewo w tablicach (dzieci, kwadraty, zakresy punktów liści) dla search_many;
+    # liście są numerowane od lewej do prawej, więc każdy węzeł obejmuje spójny fragment order
+    def flatten(self):
+        children, lower, upper, start, end, order = [], [], [], [], [], []
+        stack = [(self.root, -1, 0)]
+        size = 0
+        while stack:
+            node, parent, slot = stack.pop()
+            if node is None:
+                end[parent] = size
+                continue
+            i = len(children)
+            children.append([-1, -1, -1, -1])
+            lower.append((node.min_x, node.min_y))
+            upper.append((node.max_x, node.max_y))
+            start.append(size)
+            end.append(None)
+            if parent >= 0: children[parent][slot] = i
+
+            quarters = (node.ne, node.nw, node.sw, node.se)
+            if all(child is None for child in quarters):
+                order.append(node.indices)
+                size += len(node.indices)
+                end[i] = size
+                continue
+            #znacznik zamykający zakres węzła po przejściu jego poddrzewa
+            stack.append((None, i, 0))
+            for slot in range(3, -1, -1):
+                if quarters[slot] is not None: stack.append((quarters[slot], i, slot))
+
+        return (np.array(children, dtype = np.int64), np.array(lower, dtype = float), np.array(upper, dtype = float),
+                np.array(start, dtype = np.int64), np.array(end, dtype = np.int64),
+                np.concatenate(order).astype(np.int64), self.points)
+    #query_many odpowiada na wiele zapytań naraz; wynik w formacie CSR (offsets, indices),
+    # gdzie indices to numery wierszy self.points, a wynik i-tego zapytania to indices[offsets[i]:offsets[i + 1]]
+    def query_many(self, lowers, uppers):
+        lowers, uppers = np.asarray(lowers, dtype = float), np.asarray(uppers, dtype = float)
+        if lowers.ndim != 2 or lowers.shape != uppers.shape or lowers.shape[1] != 2:
+            raise TypeError('Points does not match declared dimension!')
+        if self.flat is None: self.flat = self.flatten()
+        #strict - węzły odrzucane tak samo jak w Rectangle.intersects
+        return search_many(*self.flat, lowers, uppers, strict = True)
+    #save zapisuje drzewo w płaskim formacie binarnym (FlatQuad), load odczytuje je bez przebudowy
+    # i deserializacji - przy mmap = True tablice są mapowane z pliku (wspólne strony w pamięci podręcznej)
+    def save(self, path):
+        FlatQuad.from_quad(self).save(path)
+    @staticmethod
+    def load(path, mmap = True):
+        return FlatQuad.load(path, mmap)
     def draw(self, visualizer, color):
         self.root.draw(visualizer, color)
 
+#range_rectangle tworzy prostokąt zapytania (współrzędne jako float, także dla skalarów numpy)
+def range_rectangle(min_point, max_point):
+    return Rectangle(float(min_point[0]), float(min_point[1]), float(max_point[0]), float(max_point[1]))
+
+#morton_codes zwraca kody Mortona (przeplecione bity współrzędnych skwantowanych do siatki 2^16 x 2^16
+# w obrębie prostokąta square) dla tablicy (m, 2) punktów
+def morton_codes(points, square):
+    codes = np.zeros(len(points), dtype = np.uint64)
+    bounds = ((square.min_x, square.max_x), (square.min_y, square.max_y))
+    for axis, (low, high) in enumerate(bounds):
+        scale = 65535.0 / (high - low) if high > low else 0.0
+        q = np.clip((points[:, axis] - low) * scale, 0, 65535).astype(np.uint64)
+        #rozsuwanie bitów: b15 ... b1 b0 -> b15 0 ... 0 b1 0 b0
+        q = (q | (q << np.uint64(8))) & np.uint64(0x00FF00FF)
+        q = (q | (q << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+        q = (q | (q << np.uint64(2))) & np.uint64(0x33333333)
+        q = (q | (q << np.uint64(1))) & np.uint64(0x55555555)
+        codes |= q << np.uint64(axis)
+    return codes
+
+#shrink_square zwraca najmniejszą komórkę powstającą z square przez kolejne podziały na ćwiartki,
+# która zawiera prostokąt [min_x, max_x] x [min_y, max_y] (ćwiartki wybierane z regułami set_partition)
+def shrink_square(square, min_x, min_y, max_x, max_y):
+    while True:
+        med_x, med_y = square.med_x(), square.med_y()
+        q = (min_x > med_x) + 2 * (min_y > med_y)
+        if q != (max_x > med_x) + 2 * (max_y > med_y): return square
+        child = square.rectangle_partition()[PARTITION[q]]
+        #kwadrat o szerokości rzędu błędu zaokrąglenia nie zmniejsza się już przy podziale
+        if (child.min_x, child.min_y, child.max_x, child.max_y) == (square.min_x, square.min_y, square.max_x, square.max_y):
+            return square
+        square = child
+
 def min_square(points):
-    min_x = min(p[0] for p in points)
-    max_x = max(p[0] for p in points)
-    min_y = min(p[1] for p in points)
-    max_y = max(p[1] for p in points)
+    points = np.asarray(points)
+    min_x, min_y = points.min(axis = 0).tolist()
+    max_x, max_y = points.max(axis = 0).tolist()
     return Rectangle(min_x, min_y, max_x, max_y)